@@ -0,0 +1,54 @@
+from functools import lru_cache
+
+import numpy as np
+
+from local_backend import EARTH_RADIUS_M
+
+# Geodesic buffers computed locally, so drawing the AOI needs no getInfo round
+# trip. Vertices are the destination points at the buffer radius along evenly
+# spaced bearings on a sphere of the mean Earth radius, for many centres at
+# once. GeoJSON for a single AOI is cached on its centre snapped to SNAP_DEGREES
+# and its radius snapped to SNAP_KM, so form resubmits reuse the geometry.
+
+SNAP_DEGREES = 1e-6
+SNAP_KM = 1e-3
+
+
+def geodesic_buffers(lons, lats, radius_m, vertices=64):
+    # Closed rings (counter-clockwise, as GeoJSON wants) of shape
+    # (centres, vertices + 1, 2) in (lon, lat) degrees. Longitudes are wrapped
+    # to [-180, 180), so rings crossing the antimeridian are not split.
+    lons = np.radians(np.atleast_1d(np.asarray(lons, dtype=np.float64)))[:, None]
+    lats = np.radians(np.atleast_1d(np.asarray(lats, dtype=np.float64)))[:, None]
+    angular = (np.broadcast_to(np.asarray(radius_m, dtype=np.float64), lons.shape[:1])
+               / EARTH_RADIUS_M)[:, None]
+    bearings = -np.linspace(0, 2 * np.pi, vertices, endpoint=False)[None, :]
+    sin_lat, cos_lat = np.sin(lats), np.cos(lats)
+    sin_d, cos_d = np.sin(angular), np.cos(angular)
+    ring_lats = np.arcsin(np.clip(sin_lat * cos_d + cos_lat * sin_d * np.cos(bearings), -1, 1))
+    ring_lons = lons + np.arctan2(np.sin(bearings) * sin_d * cos_lat,
+                                  cos_d - sin_lat * np.sin(ring_lats))
+    ring_lons = (np.degrees(ring_lons) + 180) % 360 - 180
+    rings = np.stack([ring_lons, np.degrees(ring_lats)], axis=-1)
+    return np.concatenate([rings, rings[:, :1]], axis=1)
+
+
+@lru_cache(maxsize=256)
+def _buffer_ring(lon, lat, radius_km, vertices):
+    return tuple(map(tuple, geodesic_buffers(lon, lat, radius_km * 1000, vertices)[0].tolist()))
+
+
+def buffer_geojson(lon, lat, radius_km, vertices=64):
+    # A FeatureCollection holding the buffer polygon, shaped like the getInfo()
+    # of ee.FeatureCollection([ee.Feature(aoi)])
+    ring = _buffer_ring(round(round(float(lon) / SNAP_DEGREES) * SNAP_DEGREES, 9),
+                        round(round(float(lat) / SNAP_DEGREES) * SNAP_DEGREES, 9),
+                        round(round(float(radius_km) / SNAP_KM) * SNAP_KM, 6), int(vertices))
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [[list(point) for point in ring]]},
+            'properties': {},
+        }],
+    }
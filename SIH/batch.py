@@ -0,0 +1,136 @@
+import argparse
+import csv
+import hashlib
+import json
+import re
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+import local_backend
+from change_stats import change_statistics
+from components import label_components
+from scheduler import schedule_calls
+
+# Headless change detection over many AOIs with the local backend. AOIs come
+# from CSV or JSON lines with id, lat, lon, radius_km, start1, end1, start2,
+# end2 and an optional threshold; each finished AOI is appended to
+# results.jsonl (and its rasters saved as <id>.npz, with the id made safe for
+# a file name) as soon as it completes.
+#
+#   python batch.py aois.csv --catalog catalog.jsonl --out results/
+
+
+def read_aois(path):
+    path = Path(path)
+    with open(path, newline='') as source:
+        if path.suffix.lower() == '.csv':
+            records = list(csv.DictReader(source))
+        else:
+            records = [json.loads(line) for line in source if line.strip()]
+    for index, record in enumerate(records):
+        record.setdefault('id', str(index))
+    return records
+
+
+def _threshold(record):
+    # Blank CSV cells and missing keys mean the default; 0 is a valid threshold
+    value = record.get('threshold')
+    if value is None or str(value).strip() == '':
+        return 0.1
+    return float(value)
+
+
+def _raster_name(aoi_id):
+    # Ids come from the input file, so anything but letters, digits, '-', '_'
+    # and inner dots is replaced; a changed id gets a hash suffix so that
+    # distinct ids cannot map to the same file
+    aoi_id = str(aoi_id)
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', aoi_id).lstrip('.')
+    if name != aoi_id or not name:
+        name += '_' + hashlib.sha1(aoi_id.encode()).hexdigest()[:8]
+    return name + '.npz'
+
+
+@lru_cache(maxsize=4)
+def _catalog(path):
+    # Read once per worker process
+    return local_backend.read_catalog(path)
+
+
+def run_aoi(record, catalog_path, out_dir, save_rasters, options):
+    start = time.perf_counter()
+    catalog = _catalog(catalog_path)
+    aoi = local_backend.get_buffered_aoi(float(record['lon']), float(record['lat']),
+                                         float(record['radius_km']))
+    scenes = local_backend.epoch_collection(catalog, aoi, record['start1'], record['end1'],
+                                            record['start2'], record['end2'])
+    grid = local_backend.analysis_grid(aoi, scenes, options.get('lee_radius', 1),
+                                       options.get('boxcar_radius', 1))
+    threshold = _threshold(record)
+    _, _, diff, changes = local_backend.process_images(
+        aoi, record['start1'], record['end1'], record['start2'], record['end2'], catalog, grid,
+        threshold, **options)
+
+    statistics = change_statistics(diff, changes, grid)
+    result = {
+        'id': record['id'],
+        'changed_pixels': statistics['changed_pixels'],
+        'changed_area_km2': statistics['changed_area_km2'],
+        'mean_diff': statistics['mean_diff'],
+        'change_events': label_components(changes, local_backend.DEFAULT_TILE_SHAPE)[1],
+    }
+    if save_rasters:
+        result['rasters'] = _raster_name(record['id'])
+        np.savez_compressed(Path(out_dir) / result['rasters'], diff=diff, changes=changes)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(aois, catalog_path, out_dir, workers=None, save_rasters=True, options=None,
+              report_every=10):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    calls = ((record['id'], run_aoi, (record, str(catalog_path), str(out_dir), save_rasters,
+                                      options or {}))
+             for record in aois)
+    start = time.perf_counter()
+    done = failed = 0
+    with open(out_dir / 'results.jsonl', 'a') as results:
+        for aoi_id, result, error in schedule_calls(calls, workers, ordered=False):
+            if error is not None:
+                result = {'id': aoi_id, 'error': repr(error)}
+                failed += 1
+            done += 1
+            results.write(json.dumps(result) + '\n')
+            results.flush()
+            if done % report_every == 0:
+                rate = done / (time.perf_counter() - start) * 60
+                print(f"{done} AOIs done ({failed} failed), {rate:.1f} AOIs/min", flush=True)
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed * 60 if elapsed else 0.0
+    print(f"{done} AOIs in {elapsed:.1f} s ({failed} failed), {rate:.1f} AOIs/min")
+    return done, failed, rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch SAR change detection over many AOIs")
+    parser.add_argument('aois', help="CSV or JSON lines file of AOIs and date pairs")
+    parser.add_argument('--catalog', required=True, help="JSON lines scene catalogue")
+    parser.add_argument('--out', required=True, help="Output directory")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-rasters', action='store_true', help="Only write results.jsonl")
+    parser.add_argument('--lee-radius', type=int, default=1)
+    parser.add_argument('--boxcar-radius', type=int, default=1)
+    parser.add_argument('--median-method', choices=['exact', 'histogram', 'histogram-single-pass'], default='exact')
+    args = parser.parse_args()
+    options = {'lee_radius': args.lee_radius, 'boxcar_radius': args.boxcar_radius,
+               'median_method': args.median_method}
+    run_batch(read_aois(args.aois), args.catalog, args.out, args.workers,
+              not args.no_rasters, options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import inspect
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from functools import partial
+
+import numpy as np
+
+import local_backend
+import scheduler
+import tiling
+
+# Synthetic benchmarks for the local backend. Run e.g.
+#   python benchmarks.py approx_median --scenes 60
+
+
+def speckled_stack(scenes, shape, looks=4, seed=0):
+    # Gamma-distributed multi-look speckle over a smooth backscatter field, in dB
+    rng = np.random.default_rng(seed)
+    rows, cols = shape
+    field = -15 + 5 * np.sin(np.linspace(0, 6, rows))[:, None] * np.cos(np.linspace(0, 4, cols))
+    intensity = 10 ** (field / 10) * rng.gamma(looks, 1 / looks, (scenes, rows, cols))
+    return (10 * np.log10(intensity)).astype(np.float32)
+
+
+def synthetic_collection(stack, grid):
+    return [{'id': f'scene{i}', 'date': str(np.datetime64('2024-01-01') + 6 * i),
+             'instrumentMode': 'IW', 'transmitterReceiverPolarisation': ['VV', 'VH'],
+             'bounds': local_backend.grid_bounds(grid), 'grid': grid, 'data': scene}
+            for i, scene in enumerate(stack)]
+
+
+def synthetic_grid(shape, pixel_size=0.0001, origin=(77.0, 20.0)):
+    return {'origin': origin, 'pixel_size': (pixel_size, pixel_size), 'shape': shape}
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _peak_bytes(func, *args, **kwargs):
+    # Peak memory allocated by func (numpy arrays included) above what was in use before
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def bench_approx_median(scenes=60, size=512, bins=600, value_range=(-50.0, 10.0),
+                        max_bytes=16 * 2**20):
+    grid = synthetic_grid((size, size))
+    collection = synthetic_collection(speckled_stack(scenes, (size, size)), grid)
+    end = str(np.datetime64('2024-01-01') + 6 * scenes)
+    exact_median = partial(local_backend.temporal_median, collection, '2024-01-01', end, grid,
+                           max_bytes=max_bytes)
+    exact, exact_time = _timed(exact_median)
+    coarse, fine = local_backend._histogram_split(bins)
+    print(f"{scenes} scenes of {size}x{size}, {coarse}x{fine} bins, {max_bytes / 2**20:.0f} MiB budget")
+    print(f"{'exact median':28}: {exact_time:.3f} s, peak {_peak_bytes(exact_median) / 2**20:.1f} MiB")
+    for method in ('histogram', 'histogram-single-pass'):
+        approx_median = partial(exact_median, method=method, bins=bins, value_range=value_range)
+        approx, approx_time = _timed(approx_median)
+        error = np.abs(approx - exact)
+        levels = bins if method == 'histogram-single-pass' else coarse * fine
+        print(f"{method + ' median':28}: {approx_time:.3f} s, "
+              f"peak {_peak_bytes(approx_median) / 2**20:.1f} MiB")
+        print(f"{'':28}  max error {error.max():.4f} dB, mean error {error.mean():.4f} dB, "
+              f"bound {(value_range[1] - value_range[0]) / levels / 2:.4f} dB")
+
+
+def bench_shared_memory(size=4096, workers=None, tile=512):
+    # boxcar + diff + threshold is cheap enough that moving tiles between
+    # processes dominates; compare pickled windows with shared-memory handles
+    stack = speckled_stack(2, (size, size))
+    mask = np.ones((size, size), dtype=bool)
+    chain = [(local_backend.boxcar_filter, {'radius': 1})]
+    func = partial(local_backend.change_detection_tile, chain=chain, threshold=0.1)
+    halo = tiling.chain_halo(chain)
+
+    def outputs():
+        return (np.empty((size, size), dtype=np.float32), np.empty((size, size), dtype=np.float32),
+                np.empty((size, size), dtype=np.float32), np.empty((size, size), dtype=bool))
+
+    _, serial_time = _timed(tiling.execute_tiles, func, [stack[0], stack[1], mask],
+                            (tile, tile), halo, outputs())
+    print(f"{size}x{size}, {tile}x{tile} tiles, {workers or scheduler.default_workers()} workers")
+    print(f"{'serial':13}: {serial_time:.3f} s")
+    _, elapsed = _timed(scheduler.execute_tiles_parallel, func, [stack[0], stack[1], mask],
+                        (tile, tile), halo, outputs(), workers)
+    print(f"{'pickled':13}: {elapsed:.3f} s")
+    # Inputs are copied into shared memory once, timed on their own; outputs
+    # are allocated there, so the timed run moves no raster between processes
+    with scheduler.SharedArrays() as shared:
+        start = time.perf_counter()
+        inputs = [shared.copy(stack[0]), shared.copy(stack[1]), shared.copy(mask)]
+        copy_time = time.perf_counter() - start
+        shared_outputs = [shared.empty(out.shape, out.dtype) for out in outputs()]
+        _, elapsed = _timed(scheduler.execute_tiles_parallel, func, inputs, (tile, tile), halo,
+                            shared_outputs, workers, shared=shared)
+        print(f"{'shared memory':13}: {elapsed:.3f} s (+ {copy_time:.3f} s copying inputs in)")
+        del inputs, shared_outputs
+
+
+def bench_cold_start(repeats=5, budget_ms=300):
+    # Import time of the app module in a fresh interpreter, net of interpreter
+    # start-up, with the local backend so nothing may touch Earth Engine
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, SIH_BACKEND='local')
+    probe = ("import sys, time; start = time.perf_counter(); import gglmfao; "
+             "print((time.perf_counter() - start) * 1000, 'ee' in sys.modules)")
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', probe], cwd=here, env=env, check=True,
+                                capture_output=True, text=True).stdout.split()
+        timings.append(float(output[0]))
+        if output[1] != 'False':
+            raise AssertionError("importing gglmfao imported ee")
+    best = min(timings)
+    print(f"import gglmfao: best {best:.1f} ms, worst {max(timings):.1f} ms over {repeats} runs")
+    print(f"{'within' if best < budget_ms else 'OVER'} the {budget_ms} ms budget")
+    return best
+
+
+def bench_coarse_to_fine(size=2048, scenes=8, factor=4, threshold=2.0, events=12, tile=128):
+    # Two epochs of the same speckled field with square change events of +6 dB
+    # added to the second; recall is the share of full-resolution change
+    # pixels that coarse-to-fine also reports
+    from multires import coarse_to_fine_change_detection
+
+    rng = np.random.default_rng(1)
+    grid = synthetic_grid((size, size))
+    before = speckled_stack(scenes, (size, size), seed=0)
+    after = speckled_stack(scenes, (size, size), seed=1)
+    for _ in range(events):
+        side = int(rng.integers(8, 64))
+        r, c = rng.integers(0, size - side, 2)
+        after[:, r:r + side, c:c + side] += 6
+    collection1 = synthetic_collection(before, grid)
+    collection2 = synthetic_collection(after, grid)
+    west, south, east, north = local_backend.grid_bounds(grid)
+    aoi = local_backend.get_buffered_aoi((west + east) / 2, (south + north) / 2,
+                                         (north - south) * 111 / 2)
+    mask = local_backend.aoi_mask(aoi, grid)
+
+    def full_resolution():
+        image1 = local_backend.collection_median(collection1, grid)
+        image2 = local_backend.collection_median(collection2, grid)
+        return local_backend._change_detection(image1, image2, mask, threshold, 1, 1, None,
+                                               None, False)
+
+    full, full_time = _timed(full_resolution)
+    (coarse, refined), coarse_time = _timed(coarse_to_fine_change_detection, collection1,
+                                            collection2, aoi, grid, threshold, factor=factor,
+                                            tile_shape=(tile, tile))
+    tiles = len(tiling.plan_tiles((size, size), (tile, tile), 0))
+    found = full[3] & coarse[3]
+    print(f"{scenes} + {scenes} scenes of {size}x{size}, factor {factor}, threshold {threshold} dB")
+    print(f"full resolution: {full_time:.3f} s, {int(full[3].sum())} change pixels")
+    print(f"coarse-to-fine:  {coarse_time:.3f} s ({full_time / coarse_time:.1f}x), "
+          f"{len(refined)}/{tiles} tiles refined")
+    print(f"recall {found.sum() / max(full[3].sum(), 1):.4f}, "
+          f"extra change pixels {int((coarse[3] & ~full[3]).sum())}")
+
+
+BENCHMARKS = {
+    'cold_start': bench_cold_start,
+    'approx_median': bench_approx_median,
+    'shared_memory': bench_shared_memory,
+    'coarse_to_fine': bench_coarse_to_fine,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local backend benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--scenes', type=int, default=None)
+    parser.add_argument('--size', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    benchmark = BENCHMARKS[args.benchmark]
+    options = {name: value for name, value in vars(args).items()
+               if value is not None and name in inspect.signature(benchmark).parameters}
+    benchmark(**options)
@@ -0,0 +1,80 @@
+import numpy as np
+
+import local_backend
+from scheduler import schedule_calls
+from tiling import plan_tiles
+
+# Changed-area statistics computed tile by tile with bincount reductions.
+# Partial results are plain dicts of arrays that add up elementwise, so tiles
+# can be reduced in any order, in worker processes, and merged afterwards.
+# Class 0 is unchanged and class 1 changed; masked (NaN) pixels are skipped.
+
+
+def tile_statistics(diff, changes, area, bins=50, value_range=(0, 10)):
+    # area is the per-row pixel area (m2) of the tile's rows
+    diff = np.asarray(diff)
+    valid = ~np.isnan(diff)
+    values = diff[valid]
+    classes = np.asarray(changes)[valid].astype(np.int64)
+    weights = np.broadcast_to(np.asarray(area)[:, None], diff.shape)[valid]
+    low, high = value_range
+    # Values outside the range land in the edge bins
+    index = np.clip(((values - low) * (bins / (high - low))).astype(np.int64), 0, bins - 1)
+    key = classes * bins + index
+    return {
+        'histogram': np.bincount(key, minlength=2 * bins).reshape(2, bins),
+        'area_histogram': np.bincount(key, weights=weights, minlength=2 * bins).reshape(2, bins),
+        'diff_sum': np.bincount(classes, weights=values, minlength=2),
+    }
+
+
+def merge_statistics(parts):
+    merged = None
+    for part in parts:
+        if merged is None:
+            merged = {name: value.copy() for name, value in part.items()}
+        else:
+            for name, value in part.items():
+                merged[name] += value
+    return merged
+
+
+def summarize(statistics, value_range=(0, 10)):
+    pixels = statistics['histogram'].sum(axis=1)
+    area_m2 = statistics['area_histogram'].sum(axis=1)
+    total = int(pixels.sum())
+    bins = statistics['histogram'].shape[1]
+    return {
+        'valid_pixels': total,
+        'changed_pixels': int(pixels[1]),
+        'valid_area_km2': float(area_m2.sum()) / 1e6,
+        'changed_area_km2': float(area_m2[1]) / 1e6,
+        'changed_fraction': float(area_m2[1] / area_m2.sum()) if total else None,
+        'mean_diff': float(statistics['diff_sum'].sum() / total) if total else None,
+        'mean_diff_changed': float(statistics['diff_sum'][1] / pixels[1]) if pixels[1] else None,
+        'bin_edges': np.linspace(*value_range, bins + 1),
+        'histogram': statistics['histogram'],
+        'area_histogram_km2': statistics['area_histogram'] / 1e6,
+    }
+
+
+def change_statistics(diff, changes, grid, tile_shape=None, workers=None, bins=50,
+                      value_range=(0, 10)):
+    area = local_backend.pixel_area_m2(grid)
+    tiles = plan_tiles(diff.shape, tile_shape or local_backend.DEFAULT_TILE_SHAPE, 0)
+    calls = ((tile, tile_statistics, (np.asarray(diff[tile['core']]),
+                                      np.asarray(changes[tile['core']]),
+                                      area[tile['core'][0]], bins, value_range))
+             for tile in tiles)
+    if workers is not None:
+        results = schedule_calls(calls, workers, ordered=False)
+    else:
+        results = ((tile, func(*args), None) for tile, func, args in calls)
+
+    def parts():
+        for tile, result, error in results:
+            if error is not None:
+                raise error
+            yield result
+
+    return summarize(merge_statistics(parts()), value_range)
@@ -0,0 +1,150 @@
+import numpy as np
+
+import local_backend
+from scheduler import schedule_calls
+from tiling import plan_tiles
+
+# Groups the per-pixel change mask into connected change events. Each tile is
+# labelled with a vectorized union-find over the edges between adjacent change
+# pixels, then labels that touch across tile seams are merged with a second
+# union-find over the tile labels alone, so tiles can be labelled in parallel
+# and the full mask never has to be held as edge lists.
+
+
+def _union_find(n, u, v):
+    # Root (smallest member) of each of n nodes joined by edges u-v. Each round
+    # hooks every root under its smallest neighbouring root and then compresses
+    # paths by pointer jumping, so the number of roots at least halves per round.
+    parent = np.arange(n)
+    while len(u):
+        pu, pv = parent[u], parent[v]
+        np.minimum.at(parent, np.maximum(pu, pv), np.minimum(pu, pv))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+        keep = parent[u] != parent[v]
+        u, v = u[keep], v[keep]
+    return parent
+
+
+def _offsets(connectivity):
+    if connectivity == 4:
+        return [(0, 1), (1, 0)]
+    if connectivity == 8:
+        return [(0, 1), (1, 0), (1, 1), (1, -1)]
+    raise ValueError("connectivity must be 4 or 8")
+
+
+def _pairs(array, dr, dc):
+    # (array[r, c], array[r + dr, c + dc]) for every pixel where both are in range
+    rows, cols = array.shape
+    a = array[:rows - dr, max(-dc, 0):cols - max(dc, 0)]
+    b = array[dr:, max(dc, 0):cols - max(-dc, 0)]
+    return a, b
+
+
+def label_mask(mask, connectivity=4):
+    # Labels 1..count in raster order of each component's first pixel; 0 is background
+    mask = np.asarray(mask, dtype=bool)
+    nodes = np.full(mask.shape, -1, dtype=np.int64)
+    nodes[mask] = np.arange(np.count_nonzero(mask))
+    u, v = [], []
+    for dr, dc in _offsets(connectivity):
+        a, b = _pairs(nodes, dr, dc)
+        both = (a >= 0) & (b >= 0)
+        u.append(a[both])
+        v.append(b[both])
+    roots = _union_find(np.count_nonzero(mask), np.concatenate(u), np.concatenate(v))
+    is_root = roots == np.arange(len(roots))
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    labels[mask] = np.cumsum(is_root)[roots]
+    return labels, int(is_root.sum())
+
+
+def _seam_pairs(labels, tiles, connectivity):
+    # Label pairs that touch across the top and left edge of each tile. The
+    # strips reach one pixel past the tile corners for diagonal neighbours, and
+    # the left strip is transposed, which leaves the neighbourhoods unchanged.
+    u, v = [], []
+    for tile in tiles:
+        rows, cols = tile['core']
+        strips = []
+        if rows.start:
+            strips.append(labels[rows.start - 1:rows.start + 1, max(cols.start - 1, 0):cols.stop + 1])
+        if cols.start:
+            strips.append(labels[max(rows.start - 1, 0):rows.stop + 1, cols.start - 1:cols.start + 1].T)
+        for strip in strips:
+            for dr, dc in _offsets(connectivity):
+                a, b = _pairs(strip, dr, dc)
+                both = (a > 0) & (b > 0) & (a != b)
+                u.append(a[both])
+                v.append(b[both])
+    if not u:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(u).astype(np.int64), np.concatenate(v).astype(np.int64)
+
+
+def label_components(mask, tile_shape=None, connectivity=4, workers=None, out=None):
+    # Returns (labels, count), numbered tile by tile; mask can be anything
+    # sliceable, including a LazyRaster
+    shape = mask.shape
+    tiles = plan_tiles(shape, tile_shape or shape, 0)
+    labels = out if out is not None else np.zeros(shape, dtype=np.int32)
+    # Only each tile's own slice is read and sent to a worker
+    calls = ((tile, label_mask, (np.asarray(mask[tile['core']]), connectivity)) for tile in tiles)
+    if workers is not None:
+        results = schedule_calls(calls, workers)
+    else:
+        results = ((tile, func(*args), None) for tile, func, args in calls)
+
+    count = 0
+    for tile, result, error in results:
+        if error is not None:
+            raise error
+        tile_labels, tile_count = result
+        labels[tile['core']] = np.where(tile_labels > 0, tile_labels + count, 0)
+        count += tile_count
+
+    if len(tiles) > 1:
+        u, v = _seam_pairs(labels, tiles, connectivity)
+        roots = _union_find(count + 1, u, v)
+        is_root = roots == np.arange(count + 1)
+        relabel = (np.cumsum(is_root) - 1)[roots].astype(labels.dtype)
+        for tile in tiles:
+            labels[tile['core']] = relabel[labels[tile['core']]]
+        count = int(is_root.sum()) - 1
+    return labels, count
+
+
+def component_stats(labels, count, grid):
+    # Pixel count, area (m2, geodesic per row), bounding box (row0, col0, row1,
+    # col1; end exclusive) and area-weighted centroid (lon, lat) per label 1..count
+    rows, cols = np.nonzero(labels)
+    index = labels[rows, cols].astype(np.int64) - 1
+    area = local_backend.pixel_area_m2(grid)[rows]
+    pixels = np.bincount(index, minlength=count)
+    area_m2 = np.bincount(index, weights=area, minlength=count)
+
+    bbox = np.empty((count, 4), dtype=np.int64)
+    bbox[:, :2] = np.iinfo(np.int64).max
+    bbox[:, 2:] = -1
+    np.minimum.at(bbox[:, 0], index, rows)
+    np.minimum.at(bbox[:, 1], index, cols)
+    np.maximum.at(bbox[:, 2], index, rows + 1)
+    np.maximum.at(bbox[:, 3], index, cols + 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        row = np.bincount(index, weights=area * rows, minlength=count) / area_m2
+        col = np.bincount(index, weights=area * cols, minlength=count) / area_m2
+    lon0, lat0 = grid['origin']
+    dlon, dlat = grid['pixel_size']
+    centroid = np.column_stack([lon0 + (col + 0.5) * dlon, lat0 - (row + 0.5) * dlat])
+    return {
+        'label': np.arange(1, count + 1),
+        'pixels': pixels,
+        'area_m2': area_m2,
+        'bbox': bbox,
+        'centroid': centroid,
+    }
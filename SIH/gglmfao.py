@@ -1,14 +1,42 @@
-import streamlit as st
-import folium
-import ee
-from streamlit.components.v1 import html
+import os
+import threading
 
-# Initialize Earth Engine
-ee.Authenticate()
-ee.Initialize(project='ee-dartsih')
+import map_ids
+import result_cache
+
+# Earth Engine, Streamlit and folium are imported on first use, so importing
+# this module (tests, batch workers, the local backend) stays fast and never
+# triggers authentication. SIH_BACKEND=local never imports ee at all.
+BACKEND = os.environ.get('SIH_BACKEND', 'ee')
+EE_PROJECT = 'ee-dartsih'
+
+_ee = None
+_ee_lock = threading.Lock()
+
+def get_ee():
+    global _ee
+    if _ee is None:
+        with _ee_lock:
+            if _ee is None:
+                if BACKEND == 'local':
+                    raise RuntimeError("Earth Engine is not available with SIH_BACKEND=local")
+                import ee
+                from google.auth.exceptions import DefaultCredentialsError
+                # Initialize Earth Engine, authenticating only when there are no cached
+                # credentials; any other failure (network, project, quota) is raised as is
+                try:
+                    ee.Initialize(project=EE_PROJECT)
+                except (ee.EEException, DefaultCredentialsError) as e:
+                    if isinstance(e, ee.EEException) and 'authenticate' not in str(e):
+                        raise
+                    ee.Authenticate()
+                    ee.Initialize(project=EE_PROJECT)
+                _ee = ee
+    return _ee
 
 # Add custom CSS for aesthetics
 def add_custom_css():
+    import streamlit as st
     st.markdown("""
         <style>
         body {
@@ -37,14 +65,14 @@ def add_custom_css():
         </style>
     """, unsafe_allow_html=True)
 
-add_custom_css()
-
 def get_buffered_aoi(center_lon, center_lat, radius_km):
+    ee = get_ee()
     point = ee.Geometry.Point([center_lon, center_lat])
     buffer = point.buffer(radius_km * 1000)  # Convert km to meters
     return buffer
 
 def enhanced_lee_filter(image):
+    ee = get_ee()
     weights = ee.Kernel.square(radius=1)
     mean = image.reduceNeighborhood(ee.Reducer.mean(), weights)
     variance = image.reduceNeighborhood(ee.Reducer.variance(), weights)
@@ -53,6 +81,7 @@ def enhanced_lee_filter(image):
     return result
 
 def boxcar_filter(image):
+    ee = get_ee()
     kernel = ee.Kernel.square(radius=1)
     return image.convolve(kernel)
 
@@ -62,6 +91,7 @@ def temporal_median(collection, start_date, end_date):
     return median_image
 
 def load_image_collection(aoi, start_date, end_date):
+    ee = get_ee()
     collection = ee.ImageCollection('COPERNICUS/S1_GRD') \
         .filter(ee.Filter.eq('instrumentMode', 'IW')) \
         .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'VV')) \
@@ -70,6 +100,7 @@ def load_image_collection(aoi, start_date, end_date):
 
 def process_images(aoi, start1, end1, start2, end2):
     try:
+        ee = get_ee()
         image1 = load_image_collection(aoi, start1, end1)
         image2 = load_image_collection(aoi, start2, end2)
         image1_filtered = enhanced_lee_filter(image1)
@@ -88,10 +119,119 @@ def process_images(aoi, start1, end1, start2, end2):
         return image1_boxcar, image2_boxcar, diff, changes
     
     except Exception as e:
+        import streamlit as st
         st.error(f"Error processing images: {e}")
         return None, None, None, None
 
+def change_statistics(diff, changes, aoi, scale=10):
+    # Reduced server-side in one request, so no pixels leave Earth Engine
+    ee = get_ee()
+    image = ee.Image.cat([
+        ee.Image.pixelArea().multiply(changes).rename('changed_m2'),
+        ee.Image.pixelArea().updateMask(diff.mask()).rename('valid_m2'),
+        diff.rename('diff'),
+    ])
+    reducer = ee.Reducer.sum().combine(ee.Reducer.mean(), sharedInputs=True)
+    values = image.reduceRegion(reducer, aoi, scale, maxPixels=1e10, bestEffort=True).getInfo()
+    return {
+        'changed_area_km2': (values.get('changed_m2_sum') or 0) / 1e6,
+        'valid_area_km2': (values.get('valid_m2_sum') or 0) / 1e6,
+        'mean_diff': values.get('diff_mean'),
+    }
+
+def show_statistics(statistics):
+    import streamlit as st
+    area, mean = st.columns(2)
+    area.metric("Changed area (km²)", f"{statistics['changed_area_km2']:.3f}")
+    if statistics['mean_diff'] is not None:
+        mean.metric("Mean difference", f"{statistics['mean_diff']:.3f}")
+
+def get_result_cache():
+    # Shared across reruns and sessions; repeated form submits skip process_images.
+    # Results also persist on disk in SIH_CACHE_DIR, or under SIH_STORE when only
+    # that is set; with neither, the cache is in memory only
+    directory = os.environ.get('SIH_CACHE_DIR')
+    if not directory and os.environ.get('SIH_STORE'):
+        directory = os.path.join(os.environ['SIH_STORE'], 'result_cache')
+    return result_cache.shared_cache('process_images', max_entries=32, directory=directory or None)
+
+def get_map_id_cache():
+    return map_ids.shared_cache('map_ids', ttl_seconds=3600)
+
+_raster_store = None
+
+def get_raster_store():
+    # SIH_STORE names a directory where medians and results persist between
+    # runs and processes; unset, nothing is stored
+    global _raster_store
+    if _raster_store is None and os.environ.get('SIH_STORE'):
+        from raster_store import RasterStore
+        _raster_store = RasterStore(os.environ['SIH_STORE'])
+    return _raster_store
+
+def overlay_view(image, max_side=2048):
+    # Every step-th pixel of a (possibly stored and lazily read) raster, enough
+    # for a map overlay without reading it whole
+    import numpy as np
+    step = max(1, -(-max(image.shape) // max_side))
+    return np.asarray(image[::step, ::step], dtype=np.float32)
+
+def to_rgba(image, vmin, vmax):
+    import numpy as np
+    scaled = np.clip((np.nan_to_num(image, nan=vmin) - vmin) / (vmax - vmin), 0, 1)
+    grey = (scaled * 255).astype(np.uint8)
+    alpha = np.where(np.isnan(image), 0, 255).astype(np.uint8)
+    return np.dstack([grey, grey, grey, alpha])
+
+def show_local_results(center_lat, center_lon, radius_km, start1, end1, start2, end2):
+    import folium
+    import streamlit as st
+    import streamlit.components.v1
+    import local_backend
+    from aoi_geometry import buffer_geojson
+    from change_stats import change_statistics as local_change_statistics
+
+    aoi = local_backend.get_buffered_aoi(center_lon, center_lat, radius_km)
+    try:
+        catalog = local_backend.read_catalog(os.environ['SIH_CATALOG'])
+        grid = local_backend.analysis_grid(aoi, local_backend.epoch_collection(
+            catalog, aoi, str(start1), str(end1), str(start2), str(end2)))
+        store = get_raster_store()
+        # With a store, stored medians are read tile by tile rather than whole
+        image1_boxcar, image2_boxcar, diff, changes = local_backend.process_images(
+            aoi, str(start1), str(end1), str(start2), str(end2), catalog, grid,
+            tile_shape=local_backend.DEFAULT_TILE_SHAPE if store is not None else None,
+            store=store, cache=get_result_cache())
+    except Exception as e:
+        st.error(f"Error processing images: {e}")
+        return
+
+    west, south, east, north = local_backend.grid_bounds(grid)
+    updated_map = folium.Map(location=[center_lat, center_lon], zoom_start=10)
+    for name, image, vmin, vmax in (('Image 1 (Filtered & Boxcar)', image1_boxcar, -25, 0),
+                                    ('Image 2 (Filtered & Boxcar)', image2_boxcar, -25, 0),
+                                    ('Difference Image', diff, 0, 10)):
+        folium.raster_layers.ImageOverlay(
+            image=to_rgba(overlay_view(image), vmin, vmax),
+            bounds=[[south, west], [north, east]],
+            name=name
+        ).add_to(updated_map)
+    folium.GeoJson(
+        data=buffer_geojson(center_lon, center_lat, radius_km),
+        style_function=lambda x: {'color': 'blue', 'fillOpacity': 0.1}
+    ).add_to(updated_map)
+    folium.LayerControl().add_to(updated_map)
+
+    updated_map_html = updated_map._repr_html_()
+    st.components.v1.html(updated_map_html, width=700, height=500)
+    show_statistics(local_change_statistics(diff, changes, grid))
+
 def main():
+    import folium
+    import streamlit as st
+    import streamlit.components.v1
+
+    add_custom_css()
     st.title("Space Tech SAR Change Detection")
 
     # Placeholder for coordinates
@@ -118,15 +258,24 @@ def main():
         if submitted:
             if lat_lon:
                 center_lat, center_lon = map(float, lat_lon.split(","))
+                if BACKEND == 'local':
+                    show_local_results(center_lat, center_lon, radius_km, start1, end1, start2, end2)
+                    return
+                from aoi_geometry import buffer_geojson
+                ee = get_ee()
                 aoi = get_buffered_aoi(center_lon, center_lat, radius_km)
-                image1_boxcar, image2_boxcar, diff, changes = process_images(aoi, str(start1), str(end1), str(start2), str(end2))
+                key = result_cache.normalize_key(center_lat, center_lon, radius_km, start1, end1, start2, end2)
+                image1_boxcar, image2_boxcar, diff, changes = get_result_cache().get_or_compute(
+                    key, lambda: process_images(aoi, str(start1), str(end1), str(start2), str(end2)))
 
                 if image1_boxcar and image2_boxcar and diff:
                     vis_params = {'min': -25, 'max': 0}
                     diff_vis_params = {'min': 0, 'max': 10}
-                    map_id_image1 = ee.Image(image1_boxcar).getMapId(vis_params)
-                    map_id_image2 = ee.Image(image2_boxcar).getMapId(vis_params)
-                    map_id_diff = ee.Image(diff).getMapId(diff_vis_params)
+                    map_id_image1, map_id_image2, map_id_diff = map_ids.get_map_ids([
+                        (ee.Image(image1_boxcar), vis_params),
+                        (ee.Image(image2_boxcar), vis_params),
+                        (ee.Image(diff), diff_vis_params),
+                    ], get_map_id_cache())
 
                     updated_map = folium.Map(location=[center_lat, center_lon], zoom_start=10)
                     folium.TileLayer(
@@ -148,14 +297,14 @@ def main():
                         name='Difference Image'
                     ).add_to(updated_map)
 
-                    geojson_buffer = ee.FeatureCollection([ee.Feature(aoi)]).getInfo()
                     folium.GeoJson(
-                        data=geojson_buffer,
+                        data=buffer_geojson(center_lon, center_lat, radius_km),
                         style_function=lambda x: {'color': 'blue', 'fillOpacity': 0.1}
                     ).add_to(updated_map)
 
                     updated_map_html = updated_map._repr_html_()
                     st.components.v1.html(updated_map_html, width=700, height=500)
+                    show_statistics(change_statistics(ee.Image(diff), ee.Image(changes), aoi))
 
 if __name__ == "__main__":
     main()
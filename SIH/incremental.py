@@ -0,0 +1,215 @@
+import numpy as np
+
+import local_backend
+from tiling import apply_chain
+
+# Incremental change detection for monitoring. Each epoch keeps its
+# acquisitions as a per-pixel sorted stack (NaN last) plus a small sorted
+# stack of recent additions, merged in only every max_pending acquisitions.
+# The exact median of the two is read from at most 2 * max_pending + 1
+# candidates per pixel, so a new acquisition costs time proportional to the
+# new image rather than to the length of the window, plus the re-sort of the
+# whole stack every max_pending acquisitions (amortized O(len / max_pending)
+# per pixel). Acquisitions that leave the window are removed again, each as
+# one elementwise pass over a stack, and the stacks are trimmed to the most
+# valid values any pixel holds, so memory follows the acquisitions held.
+
+
+def _sorted_stack(images, shape):
+    if not images:
+        return np.empty((0,) + tuple(shape), dtype=np.float32)
+    return np.sort(np.stack([np.asarray(image, dtype=np.float32) for image in images]), axis=0)
+
+
+def _valid_count(stack):
+    return (~np.isnan(stack)).sum(axis=0)
+
+
+def _remove_sorted(stack, image, where):
+    # Removes image's value from the sorted stack at the pixels in where; the
+    # values above it move down one slot and a NaN fills the last
+    position = (stack < image).sum(axis=0)
+    shifted = np.concatenate([stack[1:], np.full_like(stack[:1], np.nan)])
+    slots = np.arange(len(stack))[:, None, None]
+    return np.where((slots >= position) & where, shifted, stack)
+
+
+def _kth_of_union(base, base_count, pending, k):
+    # k-th smallest (0-based, per pixel) of the valid values in two sorted
+    # stacks. At least k + 1 - len(pending) of the first k + 1 values come
+    # from base, so base[:start] all precede the answer and only
+    # base[start:k + 1] and pending can hold it.
+    start = np.maximum(k - len(pending), 0)
+    offsets = np.arange(len(pending) + 1)[:, None, None]
+    index = np.minimum(start + offsets, max(len(base) - 1, 0))
+    if len(base):
+        window = np.take_along_axis(base, index, axis=0)
+        # Entries past k or past the valid values cannot be the answer
+        window[(start + offsets > k) | (start + offsets >= base_count)] = np.nan
+    else:
+        window = np.full(index.shape, np.nan, dtype=np.float32)
+    candidates = np.sort(np.concatenate([window, pending]), axis=0)
+    return np.take_along_axis(candidates, (k - start)[None], axis=0)[0]
+
+
+class IncrementalMedian:
+    def __init__(self, shape, images=(), max_pending=8):
+        self.shape = tuple(shape)
+        self.max_pending = max_pending
+        self.base = _sorted_stack(list(images), self.shape)
+        self.base_count = _valid_count(self.base)
+        self.pending = _sorted_stack([], self.shape)
+        self.size = len(self.base)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, image):
+        self.size += 1
+        image = np.asarray(image, dtype=np.float32)[None]
+        self.pending = np.sort(np.concatenate([self.pending, image]), axis=0)
+        if len(self.pending) > self.max_pending:
+            self.base = np.sort(np.concatenate([self.base, self.pending]), axis=0)
+            self.base_count = _valid_count(self.base)
+            self.pending = _sorted_stack([], self.shape)
+
+    def remove(self, image):
+        # image must be one that was added (or given at construction)
+        image = np.asarray(image, dtype=np.float32)
+        valid = ~np.isnan(image)
+        in_pending = valid & (self.pending == image).any(axis=0)
+        self.pending = _remove_sorted(self.pending, image, in_pending)
+        self.pending = self.pending[:int(_valid_count(self.pending).max(initial=0))]
+        in_base = valid & ~in_pending
+        self.base = _remove_sorted(self.base, image, in_base)
+        self.base_count = self.base_count - in_base
+        self.base = self.base[:int(self.base_count.max(initial=0))]
+        self.size -= 1
+
+    def median(self):
+        count = self.base_count + _valid_count(self.pending)
+        lower = np.maximum((count - 1) // 2, 0)
+        upper = count // 2
+        low = _kth_of_union(self.base, self.base_count, self.pending, lower)
+        high = _kth_of_union(self.base, self.base_count, self.pending, upper)
+        median = ((low.astype(np.float64) + high) / 2).astype(np.float32)
+        median[count == 0] = np.nan
+        return median
+
+
+class ChangeMonitor:
+    # Keeps a baseline and a current epoch. Adding an acquisition to either
+    # updates that epoch's median and filtered image only; diff and changes
+    # are then recomputed pointwise.
+    def __init__(self, aoi, grid, baseline_images, threshold=0.1, lee_radius=1, boxcar_radius=1,
+                 max_pending=8):
+        shape = grid['shape']
+        self.aoi = aoi
+        self.grid = grid
+        self.threshold = threshold
+        self.chain = local_backend.filter_chain(lee_radius, boxcar_radius)
+        self.mask = local_backend.aoi_mask(aoi, grid)
+        self.epochs = {'baseline': IncrementalMedian(shape, baseline_images, max_pending),
+                       'current': IncrementalMedian(shape, (), max_pending)}
+        self.filtered = {}
+
+    @classmethod
+    def from_catalog(cls, aoi, catalog, start_date, end_date, grid, **options):
+        collection = local_backend.filter_collection(catalog, aoi, start_date, end_date)
+        images = [local_backend.read_scene(scene, grid) for scene in collection]
+        return cls(aoi, grid, images, **options)
+
+    def add(self, image, epoch='current'):
+        self.epochs[epoch].add(image)
+        self.filtered.pop(epoch, None)
+
+    def remove(self, image, epoch='current'):
+        self.epochs[epoch].remove(image)
+        self.filtered.pop(epoch, None)
+
+    def _filtered(self, epoch):
+        if epoch not in self.filtered:
+            image = apply_chain(self.chain, self.epochs[epoch].median())
+            image[~self.mask] = np.nan
+            self.filtered[epoch] = image
+        return self.filtered[epoch]
+
+    def results(self):
+        if not len(self.epochs['baseline']) or not len(self.epochs['current']):
+            raise ValueError("Both epochs need at least one acquisition")
+        image1_boxcar = self._filtered('baseline')
+        image2_boxcar = self._filtered('current')
+        diff = np.abs(image2_boxcar - image1_boxcar)
+        return image1_boxcar, image2_boxcar, diff, diff > self.threshold
+
+
+# Rolling composites. The window's values are kept sorted per pixel in a
+# fixed-capacity stack, with +inf for missing values and empty slots.
+# Stepping the window removes and inserts only the acquisitions that leave
+# and enter it, each as one elementwise pass over the occupied slots instead
+# of a fresh median over the whole window.
+
+
+class RollingMedian:
+    def __init__(self, shape, capacity):
+        self.stack = np.full((capacity,) + tuple(shape), np.inf, dtype=np.float32)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.size = 0
+
+    def add(self, image):
+        image = np.asarray(image, dtype=np.float32)
+        if self.size == len(self.stack):
+            raise ValueError("Rolling window is over capacity")
+        n = self.size + 1
+        stack = self.stack[:n]
+        # Slot i of the merged stack is old[i] clamped from below by old[i - 1]
+        # and from above by the new value
+        merged = np.minimum(stack, np.nan_to_num(image, nan=np.inf))
+        np.maximum(merged[1:], stack[:-1], out=merged[1:])
+        self.stack[:n] = merged
+        self.count += ~np.isnan(image)
+        self.size = n
+
+    def remove(self, image):
+        image = np.asarray(image, dtype=np.float32)
+        n = self.size
+        stack = self.stack[:n]
+        # Entries below the removed value stay; the rest move down one slot
+        stack[:-1] = np.where(stack[:-1] < np.nan_to_num(image, nan=np.inf), stack[:-1], stack[1:])
+        stack[-1] = np.inf
+        self.count -= ~np.isnan(image)
+        self.size = n - 1
+
+    def median(self):
+        last = max(self.size - 1, 0)
+        low = np.take_along_axis(self.stack, np.clip((self.count - 1) // 2, 0, last)[None], axis=0)[0]
+        high = np.take_along_axis(self.stack, np.clip(self.count // 2, 0, last)[None], axis=0)[0]
+        median = ((low.astype(np.float64) + high) / 2).astype(np.float32)
+        median[self.count == 0] = np.nan
+        return median
+
+
+def rolling_median(collection, start_date, end_date, window_days, step_days, grid):
+    # Yields (window start, window end, median) for each full window
+    # [t, t + window_days) with t = start_date, start_date + step_days, ...
+    scenes = sorted(local_backend.filter_date(collection, start_date, end_date),
+                    key=lambda scene: np.datetime64(scene['date']))
+    dates = np.array([np.datetime64(scene['date']) for scene in scenes], dtype='datetime64[s]')
+    window, step = np.timedelta64(window_days, 'D'), np.timedelta64(step_days, 'D')
+    starts = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') - window + 1,
+                       step)
+    if not len(starts):
+        return
+    first = np.searchsorted(dates, starts)
+    last = np.searchsorted(dates, starts + window)
+    rolling = RollingMedian(grid['shape'], max(int((last - first).max()), 1))
+    held = range(0, 0)
+    for start, lo, hi in zip(starts, first, last):
+        for i in held:
+            if not lo <= i < hi:
+                rolling.remove(local_backend.read_scene(scenes[i], grid))
+        for i in range(lo, hi):
+            if i not in held:
+                rolling.add(local_backend.read_scene(scenes[i], grid))
+        held = range(lo, hi)
+        yield str(start), str(start + window), rolling.median()
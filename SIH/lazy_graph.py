@@ -0,0 +1,278 @@
+import json
+from collections import Counter
+
+import numpy as np
+
+import local_backend
+
+# Lazy local expression graph mirroring the ee.Image calls in gglmfao.py.
+# Nodes are hash-consed on (operation, inputs, parameters), so building the
+# same expression twice returns the same node, and evaluation only computes
+# what the requested outputs depend on. Values are memoized on the same kind
+# of key, except that a filterDate is keyed on the scenes it selects; two
+# date windows covering the same acquisitions then share their median and
+# everything computed from it. Each evaluation counts the consumers of every
+# node it needs and drops a value after its last consumer, so only the
+# collections, filterDate results and medians stay in the graph between calls.
+
+KEEP = ('collection', 'scenes', 'median')
+
+
+def _freeze(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class Expr:
+    def __init__(self, graph, key, op, inputs, params, payload=None):
+        self.graph = graph
+        self.key = key
+        self.op = op
+        self.inputs = inputs
+        self.params = params
+        self.payload = payload
+
+    def _binary(self, op, other):
+        if isinstance(other, Expr):
+            return self.graph._node(op, (self, other))
+        return self.graph._node(op + '_scalar', (self,), (float(other),))
+
+    def filterDate(self, start_date, end_date):
+        return self.graph._node('filterDate', (self,), (str(start_date), str(end_date)))
+
+    def median(self):
+        return self.graph._node('median', (self,))
+
+    def reduceNeighborhood(self, reducer, radius=1):
+        return self.graph._node('reduceNeighborhood', (self,), (reducer, radius))
+
+    def convolve(self, radius=1):
+        return self.graph._node('convolve', (self,), (radius,))
+
+    def clip(self, aoi):
+        return self.graph._node('clip', (self,), (_freeze(aoi),), payload=aoi)
+
+    def updateMask(self, mask):
+        return self.graph._node('updateMask', (self, mask))
+
+    def add(self, other):
+        return self._binary('add', other)
+
+    def subtract(self, other):
+        return self._binary('subtract', other)
+
+    def multiply(self, other):
+        return self._binary('multiply', other)
+
+    def divide(self, other):
+        return self._binary('divide', other)
+
+    def abs(self):
+        return self.graph._node('abs', (self,))
+
+    def gt(self, value):
+        return self.graph._node('gt', (self,), (float(value),))
+
+
+class Graph:
+    def __init__(self):
+        self.nodes = {}
+        self.resolved = {}  # node key -> value key
+        self.values = {}
+        self.evaluations = Counter()
+
+    def _node(self, op, inputs=(), params=(), payload=None):
+        key = (op, tuple(expr.key for expr in inputs), params)
+        if key not in self.nodes:
+            self.nodes[key] = Expr(self, key, op, inputs, params, payload)
+        return self.nodes[key]
+
+    def image_collection(self, catalog, aoi, grid):
+        # Stands in for ImageCollection(...).filter(IW).filter(VV).filterBounds(aoi);
+        # the catalogue is identified by object identity
+        return self._node('collection', params=(id(catalog), _freeze(aoi), _freeze(grid)),
+                          payload=(catalog, aoi, grid))
+
+    def constant(self, value, grid):
+        return self._node('constant', params=(float(value), _freeze(grid)), payload=grid)
+
+    def evaluate(self, *outputs):
+        self.consumers = Counter()  # node key -> consumers still to resolve it
+        self.pending = Counter()  # value key -> consumers still to read it
+        seen = set()
+        for expr in outputs:
+            self.consumers[expr.key] += 1  # Read once more below
+            self._count(expr, seen)
+        keys = [self._resolve(expr) for expr in outputs]
+        results = tuple(self.values[key] for key in keys)
+        for key in keys:
+            self._release(key)
+        return results
+
+    def _count(self, expr, seen):
+        # Consumers of every node this evaluation has to compute; values still
+        # in the graph are not expanded
+        if expr.key in seen or self.resolved.get(expr.key) in self.values:
+            return
+        seen.add(expr.key)
+        for child in expr.inputs:
+            self.consumers[child.key] += 1
+            self._count(child, seen)
+        if expr.op == 'reduceNeighborhood':
+            self.consumers[('neighborhood_stats', expr.inputs[0].key, expr.params[1])] += 1
+
+    def _release(self, key):
+        self.pending[key] -= 1
+        if self.pending[key] <= 0:
+            del self.pending[key]
+            if key[0] not in KEEP:
+                self.values.pop(key, None)
+
+    def _resolve(self, expr):
+        key = self.resolved.get(expr.key)
+        if key not in self.values:
+            child_keys = [self._resolve(child) for child in expr.inputs]
+            args = [self.values[key] for key in child_keys]
+            if expr.op == 'filterDate':
+                # Cheap metadata filtering, keyed on its result
+                value = self._filterDate(expr, *args)
+                scenes, grid = value
+                key = ('scenes', tuple(id(scene) for scene in scenes), _freeze(grid))
+                self.values.setdefault(key, value)
+            else:
+                key = (expr.op, tuple(child_keys), expr.params)
+                if key not in self.values:
+                    self.evaluations[expr.op] += 1
+                    self.values[key] = getattr(self, '_' + expr.op)(expr, *args)
+            self.resolved[expr.key] = key
+            del args
+            for child_key in child_keys:
+                self._release(child_key)
+        self.pending[key] += self.consumers.pop(expr.key, 0)
+        return key
+
+    def _collection(self, expr):
+        catalog, aoi, grid = expr.payload
+        return local_backend.filter_collection(catalog, aoi), grid
+
+    def _filterDate(self, expr, collection):
+        scenes, grid = collection
+        return local_backend.filter_date(scenes, *expr.params), grid
+
+    def _median(self, expr, collection):
+        scenes, grid = collection
+        if not scenes:
+            raise ValueError("No scenes in the filtered collection")
+        return local_backend.collection_median(scenes, grid)
+
+    def _reduceNeighborhood(self, expr, image):
+        reducer, radius = expr.params
+        # Mean and variance of the same window come from one pass
+        stats_key = ('neighborhood_stats', self.resolved[expr.inputs[0].key], radius)
+        if stats_key not in self.values:
+            self.values[stats_key] = local_backend._neighborhood_stats(image, radius)
+        self.pending[stats_key] += self.consumers.pop(
+            ('neighborhood_stats', expr.inputs[0].key, radius), 0)
+        mean, variance = self.values[stats_key]
+        self._release(stats_key)
+        if reducer == 'mean':
+            return mean
+        if reducer == 'variance':
+            return variance
+        raise ValueError(f"Unsupported reducer: {reducer}")
+
+    def _convolve(self, expr, image):
+        return local_backend.boxcar_filter(image, *expr.params)
+
+    def _constant(self, expr):
+        return np.full(expr.payload['shape'], expr.params[0], dtype=np.float32)
+
+    def _clip(self, expr, image):
+        grid = expr.inputs[0].payload if expr.inputs[0].op == 'constant' else None
+        if grid is None:
+            raise ValueError("clip is only supported on constant images")
+        return np.where(local_backend.aoi_mask(expr.payload, grid), image, np.nan)
+
+    def _updateMask(self, expr, image, mask):
+        return np.where(~np.isnan(mask) & (mask != 0), image, np.nan)
+
+    def _add(self, expr, a, b):
+        return a + b
+
+    def _subtract(self, expr, a, b):
+        return a - b
+
+    def _multiply(self, expr, a, b):
+        return a * b
+
+    def _divide(self, expr, a, b):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return a / b
+
+    def _add_scalar(self, expr, a):
+        return a + expr.params[0]
+
+    def _subtract_scalar(self, expr, a):
+        return a - expr.params[0]
+
+    def _multiply_scalar(self, expr, a):
+        return a * expr.params[0]
+
+    def _divide_scalar(self, expr, a):
+        return a / expr.params[0]
+
+    def _abs(self, expr, image):
+        return np.abs(image)
+
+    def _gt(self, expr, image):
+        return image > expr.params[0]
+
+
+# The chain from gglmfao.py, expressed on the graph
+
+
+def enhanced_lee_filter(image, radius=1):
+    mean = image.reduceNeighborhood('mean', radius)
+    variance = image.reduceNeighborhood('variance', radius)
+    b = variance.divide(variance.add(1e-6))  # Avoid division by zero
+    result = mean.add(b.multiply(image.subtract(mean)))
+    return result
+
+
+def boxcar_filter(image, radius=1):
+    return image.convolve(radius)
+
+
+def temporal_median(collection, start_date, end_date):
+    filtered = collection.filterDate(start_date, end_date)
+    median_image = filtered.median()
+    return median_image
+
+
+def load_image_collection(graph, aoi, start_date, end_date, catalog, grid):
+    collection = graph.image_collection(catalog, aoi, grid)
+    return temporal_median(collection, start_date, end_date)
+
+
+def build_process_images(graph, aoi, start1, end1, start2, end2, catalog, grid, threshold=0.1):
+    image1 = load_image_collection(graph, aoi, start1, end1, catalog, grid)
+    image2 = load_image_collection(graph, aoi, start2, end2, catalog, grid)
+    image1_filtered = enhanced_lee_filter(image1)
+    image2_filtered = enhanced_lee_filter(image2)
+    image1_boxcar = boxcar_filter(image1_filtered)
+    image2_boxcar = boxcar_filter(image2_filtered)
+
+    mask = graph.constant(1, grid).clip(aoi)
+    image1_boxcar = image1_boxcar.updateMask(mask)
+    image2_boxcar = image2_boxcar.updateMask(mask)
+    diff = image2_boxcar.subtract(image1_boxcar).abs()
+
+    changes = diff.gt(threshold)
+
+    return image1_boxcar, image2_boxcar, diff, changes
+
+
+def process_images(aoi, start1, end1, start2, end2, catalog, grid, threshold=0.1, graph=None):
+    # Pass the same graph to several calls to share medians between them
+    graph = graph or Graph()
+    return graph.evaluate(*build_process_images(graph, aoi, start1, end1, start2, end2,
+                                                catalog, grid, threshold))
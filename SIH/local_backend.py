@@ -0,0 +1,673 @@
+import json
+import warnings
+from functools import lru_cache, partial
+from pathlib import Path
+
+import numpy as np
+
+import rasterize
+from raster_store import store_key
+from result_cache import normalize_key
+from scene_index import SceneIndex
+from scheduler import execute_tiles_parallel
+from tiling import apply_chain, chain_halo, run_chain_tiled
+
+# Local NumPy backend mirroring the Earth Engine chain in gglmfao.py.
+# Images are 2D float arrays in dB with NaN standing in for masked pixels.
+# A grid is {'origin': (lon, lat) of the top-left corner,
+#            'pixel_size': (dlon, dlat) in degrees, 'shape': (rows, cols)}.
+# A scene is a dict with 'id', 'date', 'instrumentMode',
+# 'transmitterReceiverPolarisation', 'bounds' (west, south, east, north),
+# 'grid' and 'data' (an array or the path of a .npy file).
+
+EARTH_RADIUS_M = 6371008.8
+DEFAULT_TILE_SHAPE = (1024, 1024)
+RESULT_NAMES = ('image1_boxcar', 'image2_boxcar', 'diff', 'changes')
+
+
+def get_buffered_aoi(center_lon, center_lat, radius_km):
+    return {'center': (center_lon, center_lat), 'radius_m': radius_km * 1000}
+
+
+def aoi_bounds(aoi):
+    if 'coordinates' in aoi:
+        points = np.concatenate(rasterize.polygon_rings(aoi))
+        return (*points.min(axis=0), *points.max(axis=0))
+    lon, lat = aoi['center']
+    angle = aoi['radius_m'] / EARTH_RADIUS_M
+    dlat = np.degrees(angle)
+    # The widest point of the circle is slightly poleward of its centre; a
+    # circle reaching over a pole spans every longitude
+    ratio = np.sin(angle) / max(np.cos(np.radians(lat)), 1e-12)
+    dlon = np.degrees(np.arcsin(ratio)) if ratio < 1 else 180.0
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+
+def pixel_centers(grid):
+    lon0, lat0 = grid['origin']
+    dlon, dlat = grid['pixel_size']
+    rows, cols = grid['shape']
+    lons = lon0 + (np.arange(cols) + 0.5) * dlon
+    lats = lat0 - (np.arange(rows) + 0.5) * dlat
+    return lons, lats
+
+
+def pixel_area_m2(grid):
+    # Area of one pixel in each row on a sphere of the mean Earth radius; pixels
+    # in a row of a lat/lon grid all have the same area
+    lon0, lat0 = grid['origin']
+    dlon, dlat = grid['pixel_size']
+    edges = np.radians(lat0 - np.arange(grid['shape'][0] + 1) * dlat)
+    return EARTH_RADIUS_M ** 2 * np.radians(dlon) * np.abs(np.sin(edges[:-1]) - np.sin(edges[1:]))
+
+
+def _circle_spans(aoi, grid):
+    # Per row, the pixel centres within the haversine distance of the centre
+    # form one run of columns: hav(d) <= hav(dlat) + cos(lat0) cos(lat) hav(dlon)
+    # solved for dlon
+    lon, lat = aoi['center']
+    lons, lats = pixel_centers(grid)
+    dlon_pixel = grid['pixel_size'][0]
+    phi, phi0 = np.radians(lats), np.radians(lat)
+    limit = np.sin(aoi['radius_m'] / EARTH_RADIUS_M / 2) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = (limit - np.sin((phi - phi0) / 2) ** 2) / (np.cos(phi0) * np.cos(phi))
+    half_width = np.degrees(2 * np.arcsin(np.sqrt(np.clip(s, 0, 1))))
+    half_width[~(s >= 0)] = -np.inf
+    start = np.clip(np.ceil((lon - half_width - lons[0]) / dlon_pixel), 0, len(lons))
+    stop = np.clip(np.floor((lon + half_width - lons[0]) / dlon_pixel) + 1, 0, len(lons))
+    start[~np.isfinite(half_width)] = stop[~np.isfinite(half_width)] = 0
+    return np.arange(len(lats)), start.astype(np.int64), stop.astype(np.int64)
+
+
+def _freeze(value):
+    # NumPy scalars in grids become plain numbers, so the key round-trips
+    return json.dumps(value, sort_keys=True, default=lambda item: item.item())
+
+
+@lru_cache(maxsize=64)
+def _aoi_mask_bits(aoi_key, grid_key):
+    aoi, grid = json.loads(aoi_key), json.loads(grid_key)
+    if 'coordinates' in aoi:
+        spans = rasterize.polygon_spans(rasterize.polygon_rings(aoi), grid)
+    else:
+        spans = _circle_spans(aoi, grid)
+    bits = rasterize.fill_spans(*spans, grid['shape'], packed=True)
+    bits.setflags(write=False)
+    return bits
+
+
+def aoi_mask(aoi, grid, window=(slice(None), slice(None))):
+    # Rasterized once per (AOI, grid) and kept packed to bits; a circle AOI
+    # covers the pixel centres within radius_m, a GeoJSON polygon the centres
+    # inside it
+    bits = _aoi_mask_bits(_freeze(aoi), _freeze(grid))
+    return rasterize.unpack_rows(bits[window[0]], grid['shape'][1])[:, window[1]]
+
+
+def grid_bounds(grid):
+    lon0, lat0 = grid['origin']
+    dlon, dlat = grid['pixel_size']
+    rows, cols = grid['shape']
+    return lon0, lat0 - rows * dlat, lon0 + cols * dlon, lat0
+
+
+def _scene_from_json(record, root):
+    scene = dict(record)
+    scene['bounds'] = tuple(scene['bounds'])
+    scene['grid'] = {name: tuple(value) for name, value in scene['grid'].items()}
+    scene['data'] = root / scene['data']
+    return scene
+
+
+def read_catalog(path):
+    # JSON lines of scene records; data paths are relative to the catalogue file
+    path = Path(path)
+    if path.suffix in ('.sqlite', '.db'):
+        from sqlite_catalog import SQLiteCatalog
+        return SQLiteCatalog(path)
+    with open(path) as lines:
+        return SceneIndex(_scene_from_json(json.loads(line), path.parent)
+                          for line in lines if line.strip())
+
+
+def _intersects(bounds, other):
+    return not (bounds[2] < other[0] or bounds[0] > other[2]
+                or bounds[3] < other[1] or bounds[1] > other[3])
+
+
+def grid_window(grid, window):
+    rows, cols = window
+    lon0, lat0 = grid['origin']
+    dlon, dlat = grid['pixel_size']
+    return {'origin': (lon0 + cols.start * dlon, lat0 - rows.start * dlat),
+            'pixel_size': grid['pixel_size'],
+            'shape': (rows.stop - rows.start, cols.stop - cols.start)}
+
+
+def aoi_window(aoi, grid, halo=0, clip=True):
+    # Pixel window of grid covering the AOI's bounding box plus halo pixels
+    # on every side, clipped to the grid unless clip is False (the window may
+    # then start at negative offsets or reach past the grid)
+    west, south, east, north = aoi_bounds(aoi)
+    lon0, lat0 = grid['origin']
+    dlon, dlat = grid['pixel_size']
+    rows, cols = grid['shape']
+    r0 = int(np.floor((lat0 - north) / dlat)) - halo
+    r1 = int(np.ceil((lat0 - south) / dlat)) + halo
+    c0 = int(np.floor((west - lon0) / dlon)) - halo
+    c1 = int(np.ceil((east - lon0) / dlon)) + halo
+    if clip:
+        r0, r1, c0, c1 = max(r0, 0), min(r1, rows), max(c0, 0), min(c1, cols)
+    if r1 <= r0 or c1 <= c0:
+        raise ValueError("The AOI does not overlap the grid")
+    return slice(r0, r1), slice(c0, c1)
+
+
+def lattice_grid(aoi, collection, halo=0):
+    # The AOI window (plus halo) on the pixel lattice the scenes share. It is
+    # not clipped to any one scene; read_scene pads whatever a scene does not
+    # cover, so the median covers the AOI wherever any scene does.
+    if not collection:
+        raise ValueError("No scenes intersect the AOI")
+    lattice = collection[0]['grid']
+    for scene in collection[1:]:
+        if _lattice_offset(lattice, scene['grid']) is None:
+            raise ValueError(f"Scenes {collection[0].get('id')} and {scene.get('id')} are not "
+                             "on one pixel lattice")
+    return grid_window(lattice, aoi_window(aoi, lattice, halo, clip=False))
+
+
+def analysis_grid(aoi, collection, lee_radius=1, boxcar_radius=1):
+    # The AOI window on the scenes' lattice, padded by the filter halo so the
+    # filtered AOI pixels match a whole-scene run
+    return lattice_grid(aoi, collection, chain_halo(filter_chain(lee_radius, boxcar_radius)))
+
+
+def _lattice_offset(source, target):
+    # (row, col) of target's first pixel in source, if both share one pixel lattice
+    if not np.allclose(source['pixel_size'], target['pixel_size'], rtol=1e-9, atol=0):
+        return None
+    dlon, dlat = source['pixel_size']
+    offset = np.array([(source['origin'][1] - target['origin'][1]) / dlat,
+                       (target['origin'][0] - source['origin'][0]) / dlon])
+    if not np.allclose(offset, np.round(offset), atol=1e-6):
+        return None
+    return tuple(int(value) for value in np.round(offset))
+
+
+class PaddedWindow:
+    # A window of a scene that reaches past the scene's edges. Nothing is
+    # read up front; indexing reads the overlapping part of the requested rows
+    # and columns and fills the rest with NaN, so a row block costs only its
+    # own rows.
+    ndim = 2
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, data, offset, shape):
+        self.data = data
+        self.offset = offset
+        self.shape = tuple(shape)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        squeeze = tuple(isinstance(index, (int, np.integer)) for index in key)
+        (r0, r1, row_step), (c0, c1, col_step) = [
+            (index, index + 1, 1) if single else index.indices(size)
+            for index, single, size in zip(key, squeeze, self.shape)]
+        if row_step != 1 or col_step != 1:
+            raise IndexError("PaddedWindow only supports contiguous slices")
+        r1, c1 = max(r1, r0), max(c1, c0)
+        out = np.full((r1 - r0, c1 - c0), np.nan, dtype=self.dtype)
+        row_offset, col_offset = self.offset
+        sr0, sr1 = max(r0 + row_offset, 0), min(r1 + row_offset, self.data.shape[0])
+        sc0, sc1 = max(c0 + col_offset, 0), min(c1 + col_offset, self.data.shape[1])
+        if sr1 > sr0 and sc1 > sc0:
+            out[sr0 - row_offset - r0:sr1 - row_offset - r0,
+                sc0 - col_offset - c0:sc1 - col_offset - c0] = self.data[sr0:sr1, sc0:sc1]
+        if squeeze[1]:
+            out = out[:, 0]
+        return out[0] if squeeze[0] else out
+
+    def __array__(self, dtype=None, copy=None):
+        window = self[:, :]
+        return window if dtype is None else window.astype(dtype)
+
+
+def read_scene(scene, grid):
+    # grid may be any window on the scene's pixel lattice; only that window is
+    # read, and pixels of it outside the scene come back masked
+    offset = _lattice_offset(scene['grid'], grid) if scene['grid'] != grid else (0, 0)
+    if offset is None:
+        raise ValueError(f"Scene {scene.get('id')} is not on the requested grid")
+    data = scene['data']
+    if isinstance(data, (str, Path)):
+        data = np.load(data, mmap_mode='r')
+    (r0, c0), (rows, cols) = offset, grid['shape']
+    if r0 >= 0 and c0 >= 0 and r0 + rows <= data.shape[0] and c0 + cols <= data.shape[1]:
+        return data[r0:r0 + rows, c0:c0 + cols]
+    return PaddedWindow(data, (r0, c0), (rows, cols))
+
+
+def _integral_image(x):
+    sat = np.zeros((x.shape[0] + 1, x.shape[1] + 1))
+    np.cumsum(x, axis=0, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def _window_sums(sat, radius):
+    # Sum over each pixel's (2r+1)x(2r+1) window, clipped at the image edges,
+    # from four lookups into the summed-area table. Edge-padding the table
+    # clamps the lookups so they can be plain slices.
+    rows, cols = sat.shape[0] - 1, sat.shape[1] - 1
+    k = 2 * radius + 1
+    sat = np.pad(sat, radius, mode='edge')
+    return (sat[k:k + rows, k:k + cols] - sat[:rows, k:k + cols]
+            - sat[k:k + rows, :cols] + sat[:rows, :cols])
+
+
+def _neighborhood_stats(image, radius):
+    valid = ~np.isnan(image)
+    # Shifting by the image mean keeps the running sums small, so the
+    # sum-of-squares variance does not lose precision to cancellation
+    shift = np.nanmean(image) if valid.any() else 0.0
+    x = np.where(valid, image - shift, 0.0)
+    count = _window_sums(_integral_image(valid), radius)
+    total = _window_sums(_integral_image(x), radius)
+    total_sq = _window_sums(_integral_image(x * x), radius)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean * mean, 0.0)
+    return mean + shift, variance
+
+
+def enhanced_lee_filter(image, radius=1):
+    mean, variance = _neighborhood_stats(image, radius)
+    b = variance / (variance + 1e-6)  # Avoid division by zero
+    result = mean + b * (image - mean)
+    return result.astype(np.float32)
+
+
+def _running_box_sum(x, radius, axis):
+    # Windowed sum along one axis, clipped at the edges, written back into x
+    x = np.moveaxis(x, axis, 0)
+    n = x.shape[0]
+    csum = np.empty((n + 1,) + x.shape[1:])
+    csum[0] = 0
+    np.cumsum(x, axis=0, out=csum[1:])
+    index = np.arange(n)
+    if n > 2 * radius:
+        np.subtract(csum[2 * radius + 1:], csum[:n - 2 * radius], out=x[radius:n - radius])
+        index = np.r_[index[:radius], index[n - radius:]]
+    x[index] = (csum[np.minimum(index + radius + 1, n)]
+                - csum[np.maximum(index - radius, 0)])
+
+
+def boxcar_filter(image, radius=1):
+    valid = ~np.isnan(image)
+    total = np.where(valid, image, 0.0)
+    _running_box_sum(total, radius, 0)
+    _running_box_sum(total, radius, 1)
+    if valid.all():
+        # Without masked pixels the window counts are separable too
+        rows = np.ones((image.shape[0], 1))
+        cols = np.ones((1, image.shape[1]))
+        _running_box_sum(rows, radius, 0)
+        _running_box_sum(cols, radius, 1)
+        count = rows * cols
+    else:
+        count = valid.astype(np.float64)
+        _running_box_sum(count, radius, 0)
+        _running_box_sum(count, radius, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.divide(total, count, out=total)
+    # Masked pixels stay masked, as with the input mask in Earth Engine
+    total[~valid] = np.nan
+    return total.astype(np.float32)
+
+
+def _histogram_split(bins):
+    # (coarse, fine) bin counts with coarse * fine >= bins
+    coarse = int(np.ceil(np.sqrt(bins)))
+    return coarse, int(np.ceil(bins / coarse))
+
+
+def _find_bin(counts, rank):
+    # Per pixel, the bin holding the value of 0-based rank and the number of
+    # values in the bins before it (-1 where there are too few values). One
+    # pass over the bins with a running count, rather than a cumulative sum
+    # over all of them.
+    found = np.full(len(counts), -1, dtype=np.int32)
+    below = np.zeros(len(counts), dtype=np.int32)
+    for k in range(counts.shape[1]):
+        column = counts[:, k]
+        searching = found < 0
+        hit = searching & (below + column > rank)
+        found[hit] = k
+        below += np.where(searching & ~hit, column, 0).astype(np.int32)
+    return found, below
+
+
+def _histogram_median(scenes, rows, bins, value_range, single_pass=False):
+    # Per-pixel two-level histogram in fixed-width dB bins. A first pass counts
+    # values in coarse bins and finds the coarse bins holding the two middle
+    # order statistics; a second pass splits only those two bins into fine
+    # bins. The median is the centre of the fine bin holding each middle value,
+    # so it is within half a fine bin width of the exact median for values
+    # inside value_range (values outside it are clamped to the edge bins).
+    # With single_pass, each scene is read once into one level of bins bins:
+    # the same error bound for about sqrt(bins)/2 times the count memory, for
+    # stacks where a second read costs more than memory (e.g. memory-mapped).
+    # Counts fit the smallest integer type for the number of scenes, and every
+    # histogram has a last column that collects masked values and values
+    # outside the bins of interest, so each scene is one dense scatter.
+    lo, hi = value_range
+    coarse, fine = (bins, 1) if single_pass else _histogram_split(bins)
+    scale = coarse * fine / (hi - lo)
+    shape = scenes[0][rows].shape
+    pixels = shape[0] * shape[1]
+    count_type = np.min_scalar_type(len(scenes))
+
+    def bin_indices(scene):
+        values = np.asarray(scene[rows], dtype=np.float32).reshape(-1)
+        index = np.clip((values - lo) * scale, 0, coarse * fine - 1)
+        index[np.isnan(values)] = coarse * fine
+        return index.astype(np.int32)
+
+    counts = np.zeros((pixels, coarse + 1), dtype=count_type)
+    offsets = np.arange(pixels) * (coarse + 1)
+    for scene in scenes:
+        counts.reshape(-1)[offsets + bin_indices(scene) // fine] += 1
+    n = len(scenes) - counts[:, coarse].astype(np.int32)
+    lower_rank, upper_rank = (n - 1) // 2, n // 2
+    lower_bin, lower_below = _find_bin(counts[:, :coarse], lower_rank)
+    upper_bin, upper_below = _find_bin(counts[:, :coarse], upper_rank)
+    del counts
+    if single_pass:
+        median = (lo + ((lower_bin + upper_bin) / 2 + 0.5) / scale).astype(np.float32)
+        median[n == 0] = np.nan
+        return median.reshape(shape)
+
+    # Fine counts of the lower middle value's coarse bin, then of the upper's
+    # when it is a different bin
+    counts = np.zeros((pixels, 2 * fine + 1), dtype=count_type)
+    offsets = np.arange(pixels) * (2 * fine + 1)
+    for scene in scenes:
+        index = bin_indices(scene)
+        coarse_index, fine_index = np.divmod(index, fine)
+        column = np.where(coarse_index == lower_bin, fine_index,
+                          np.where(coarse_index == upper_bin, fine + fine_index, 2 * fine))
+        counts.reshape(-1)[offsets + column] += 1
+    lower_fine, _ = _find_bin(counts[:, :fine], lower_rank - lower_below)
+    shared = (upper_bin == lower_bin)[:, None]
+    upper_fine, _ = _find_bin(np.where(shared, counts[:, :fine], counts[:, fine:2 * fine]),
+                              upper_rank - upper_below)
+
+    lower = lower_bin * fine + lower_fine
+    upper = upper_bin * fine + upper_fine
+    median = (lo + ((lower + upper) / 2 + 0.5) / scale).astype(np.float32)
+    median[n == 0] = np.nan
+    return median.reshape(shape)
+
+
+def filter_date(collection, start_date, end_date):
+    start, end = np.datetime64(start_date), np.datetime64(end_date)
+    return [scene for scene in collection if start <= np.datetime64(scene['date']) < end]
+
+
+def epoch_collection(catalog, aoi, start1, end1, start2, end2):
+    # Scenes of either epoch; the analysis grid has to cover these and only these
+    return (filter_collection(catalog, aoi, start1, end1)
+            + filter_collection(catalog, aoi, start2, end2))
+
+
+def temporal_median(collection, start_date, end_date, grid, max_bytes=256 * 2**20, out=None,
+                    method='exact', bins=600, value_range=(-50.0, 10.0)):
+    filtered = filter_date(collection, start_date, end_date)
+    if not filtered:
+        raise ValueError(f"No scenes between {start_date} and {end_date}")
+    return collection_median(filtered, grid, max_bytes, out, method, bins, value_range)
+
+
+def collection_median(collection, grid, max_bytes=256 * 2**20, out=None, method='exact', bins=600,
+                      value_range=(-50.0, 10.0)):
+    if method not in ('exact', 'histogram', 'histogram-single-pass'):
+        raise ValueError(f"Unknown median method: {method}")
+    scenes = [read_scene(scene, grid) for scene in collection]
+    rows, cols = grid['shape']
+    if out is None:
+        out = np.empty((rows, cols), dtype=np.float32)
+
+    # Read the time stack one block of rows at a time so that only the block
+    # and the median's working memory for it are ever resident; max_bytes
+    # bounds both, not counting out
+    if method == 'exact':
+        # np.nanmedian peaks at about 5x its input (copies, NaN masks and
+        # partition indices) plus up to ~60 bytes a pixel, on top of the stack
+        pixel_bytes = 6 * len(scenes) * np.dtype(np.float32).itemsize + 64
+    else:
+        # Coarse and two fine histograms (or the one single-pass histogram),
+        # plus about 96 bytes of per-pixel ranks, bin indices and temporaries
+        # for one scene
+        coarse, fine = _histogram_split(bins)
+        columns = bins if method == 'histogram-single-pass' else coarse + 2 * fine
+        pixel_bytes = columns * np.min_scalar_type(len(scenes)).itemsize + 96
+    block_rows = int(min(rows, max(1, max_bytes // (pixel_bytes * cols))))
+    if method == 'exact':
+        stack = np.empty((len(scenes), block_rows, cols), dtype=np.float32)
+    for row in range(0, rows, block_rows):
+        n = min(block_rows, rows - row)
+        if method != 'exact':
+            out[row:row + n] = _histogram_median(scenes, slice(row, row + n), bins, value_range,
+                                                 method == 'histogram-single-pass')
+            continue
+        for i, scene in enumerate(scenes):
+            stack[i, :n] = scene[row:row + n]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN pixels stay NaN
+            out[row:row + n] = np.nanmedian(stack[:, :n], axis=0)
+    return out
+
+
+def filter_collection(catalog, aoi, start_date=None, end_date=None):
+    # Dates, when given, go to the catalogue's time index along with the bounds
+    bounds = aoi_bounds(aoi)
+    if hasattr(catalog, 'query'):
+        return catalog.query(bounds, start_date, end_date)
+    collection = [scene for scene in catalog
+                  if scene['instrumentMode'] == 'IW'
+                  and 'VV' in scene['transmitterReceiverPolarisation']
+                  and _intersects(scene['bounds'], bounds)]
+    if start_date is None and end_date is None:
+        return collection
+    return filter_date(collection, start_date or '0001-01-01', end_date or '9999-12-31')
+
+
+def load_image_collection(aoi, start_date, end_date, catalog, grid=None, halo=0,
+                          **median_options):
+    # Without a grid, only the AOI window (plus halo) of the scenes is read
+    collection = filter_collection(catalog, aoi, start_date, end_date)
+    if not collection:
+        raise ValueError(f"No scenes between {start_date} and {end_date}")
+    if grid is None:
+        grid = lattice_grid(aoi, collection, halo)
+    return collection_median(collection, grid, **median_options)
+
+
+def filter_chain(lee_radius=1, boxcar_radius=1):
+    return [(enhanced_lee_filter, {'radius': lee_radius}),
+            (boxcar_filter, {'radius': boxcar_radius})]
+
+
+def change_detection_tile(image1, image2, mask, chain, threshold):
+    image1_boxcar = apply_chain(chain, image1)
+    image2_boxcar = apply_chain(chain, image2)
+    image1_boxcar[~mask] = np.nan
+    image2_boxcar[~mask] = np.nan
+    diff = np.abs(image2_boxcar - image1_boxcar)
+    return image1_boxcar, image2_boxcar, diff, diff > threshold
+
+
+def _process_tiles_parallel(image1, image2, mask, chain, threshold, tile_shape, workers,
+                            shared):
+    shape = image1.shape
+    outputs = (np.full(shape, np.nan, dtype=np.float32), np.full(shape, np.nan, dtype=np.float32),
+               np.full(shape, np.nan, dtype=np.float32), np.zeros(shape, dtype=bool))
+    func = partial(change_detection_tile, chain=chain, threshold=threshold)
+    errors = execute_tiles_parallel(func, [image1, image2, mask], tile_shape, chain_halo(chain),
+                                    outputs, workers, shared=shared)
+    for tile, error in errors:
+        # A failed tile is left masked rather than failing the whole scene
+        warnings.warn(f"Tile {tile['index']} failed and was left masked: {error!r}")
+    return outputs
+
+
+def fused_change_detection(image1, image2, aoi, grid, threshold=0.1, lee_radius=1,
+                           boxcar_radius=1, block_rows=64, outputs=None):
+    # Streams blocks of rows through lee -> boxcar -> mask -> diff -> threshold.
+    # Only the input bands, a rolling buffer of lee rows and one block of each
+    # later stage are held; lee rows still needed by the next block's boxcar
+    # halo are carried over rather than recomputed. outputs may be memmaps,
+    # and either image output may be None to skip writing it. On 2000x2000
+    # with memmapped diff/changes, the working set is ~10 MiB at 64 rows (41
+    # MiB at 256); in-memory outputs add 13 bytes a pixel.
+    rows, cols = image1.shape
+    if outputs is None:
+        outputs = (np.full((rows, cols), np.nan, dtype=np.float32),
+                   np.full((rows, cols), np.nan, dtype=np.float32),
+                   np.full((rows, cols), np.nan, dtype=np.float32),
+                   np.zeros((rows, cols), dtype=bool))
+    lee_bands = [np.empty((0, cols), dtype=np.float32) for _ in range(2)]
+    lee_start = lee_stop = 0  # rows of the image held in lee_bands
+    for r0 in range(0, rows, block_rows):
+        r1 = min(r0 + block_rows, rows)
+        need0, need1 = max(r0 - boxcar_radius, 0), min(r1 + boxcar_radius, rows)
+        in0, in1 = max(lee_stop - lee_radius, 0), min(need1 + lee_radius, rows)
+        boxcars = []
+        for i, image in enumerate((image1, image2)):
+            band = np.asarray(image[in0:in1], dtype=np.float32)
+            lee = enhanced_lee_filter(band, lee_radius)[lee_stop - in0:need1 - in0]
+            lee_bands[i] = np.concatenate([lee_bands[i][need0 - lee_start:], lee])
+            boxcars.append(boxcar_filter(lee_bands[i], boxcar_radius)[r0 - need0:r1 - need0])
+        lee_start, lee_stop = need0, need1
+
+        image1_boxcar, image2_boxcar = boxcars
+        mask = aoi_mask(aoi, grid, (slice(r0, r1), slice(None)))
+        image1_boxcar[~mask] = np.nan
+        image2_boxcar[~mask] = np.nan
+        diff = np.abs(image2_boxcar - image1_boxcar)
+        for out, result in zip(outputs, (image1_boxcar, image2_boxcar, diff, diff > threshold)):
+            if out is not None:
+                out[r0:r1] = result
+    return outputs
+
+
+def _stored_median(aoi, start_date, end_date, catalog, grid, method, store, scene_ids):
+    if store is None:
+        return load_image_collection(aoi, start_date, end_date, catalog, grid, method=method)
+    name = 'median/' + store_key(aoi, start_date, end_date, grid, method, scene_ids)
+    if name in store:
+        # Opened lazily; tiled and fused runs read only the windows they need
+        return store.open(name)
+    median_image = load_image_collection(aoi, start_date, end_date, catalog, grid, method=method)
+    store.put(name, median_image, {'start': start_date, 'end': end_date, 'method': method})
+    return median_image
+
+
+def _change_detection(image1, image2, mask, threshold, lee_radius, boxcar_radius, tile_shape,
+                      workers, shared_memory):
+    if workers is not None:
+        return _process_tiles_parallel(image1, image2, mask,
+                                       filter_chain(lee_radius, boxcar_radius), threshold,
+                                       tile_shape or DEFAULT_TILE_SHAPE, workers, shared_memory)
+    if tile_shape is None:
+        image1_filtered = enhanced_lee_filter(np.asarray(image1, dtype=np.float32), lee_radius)
+        image2_filtered = enhanced_lee_filter(np.asarray(image2, dtype=np.float32), lee_radius)
+        image1_boxcar = boxcar_filter(image1_filtered, boxcar_radius)
+        image2_boxcar = boxcar_filter(image2_filtered, boxcar_radius)
+    else:
+        chain = filter_chain(lee_radius, boxcar_radius)
+        image1_boxcar = run_chain_tiled(chain, image1, tile_shape)
+        image2_boxcar = run_chain_tiled(chain, image2, tile_shape)
+
+    image1_boxcar[~mask] = np.nan
+    image2_boxcar[~mask] = np.nan
+    diff = np.abs(image2_boxcar - image1_boxcar)
+
+    changes = diff > threshold
+
+    return image1_boxcar, image2_boxcar, diff, changes
+
+
+def process_images(aoi, start1, end1, start2, end2, catalog, grid=None, threshold=0.1,
+                   lee_radius=1, boxcar_radius=1, median_method='exact', tile_shape=None,
+                   workers=None, shared_memory=False, store=None, fused=False, cache=None,
+                   coarse_factor=None, coarse_threshold=None, block_rows=64, outputs=None):
+    # block_rows and outputs (e.g. memmaps, or None to skip an image output)
+    # are passed to fused_change_detection when fused is set
+    # Only scenes of the two epochs are queried, so the keys below do not
+    # change when scenes of other dates are added to the catalogue
+    collection = epoch_collection(catalog, aoi, start1, end1, start2, end2)
+    if grid is None:
+        grid = analysis_grid(aoi, collection, lee_radius, boxcar_radius)
+    scene_ids = sorted(str(scene.get('id')) for scene in collection)
+
+    if cache is not None:
+        options = dict(lee_radius=lee_radius, boxcar_radius=boxcar_radius,
+                       median_method=median_method, grid=repr(grid), scenes=tuple(scene_ids),
+                       coarse_factor=coarse_factor, coarse_threshold=coarse_threshold)
+        if 'center' in aoi:
+            lon, lat = aoi['center']
+            key = normalize_key(lat, lon, aoi['radius_m'] / 1000, start1, end1, start2, end2,
+                                threshold, **options)
+        else:
+            # Polygons have no centre and radius to round; key on the geometry as given
+            key = normalize_key(0, 0, 0, start1, end1, start2, end2, threshold,
+                                geometry=_freeze(aoi), **options)
+        return cache.get_or_compute(key, lambda: process_images(
+            aoi, start1, end1, start2, end2, catalog, grid, threshold, lee_radius, boxcar_radius,
+            median_method, tile_shape, workers, shared_memory, store, fused, None, coarse_factor,
+            coarse_threshold, block_rows, outputs))
+
+    # With a RasterStore, medians and results persist between runs and a
+    # repeated request opens the stored rasters lazily instead of recomputing
+    if store is not None:
+        key = store_key(aoi, start1, end1, start2, end2, grid, threshold, lee_radius,
+                        boxcar_radius, median_method, scene_ids,
+                        *([coarse_factor, coarse_threshold] if coarse_factor else []))
+        names = [f"results/{key}/{name}" for name in RESULT_NAMES]
+        if all(name in store for name in names):
+            return tuple(store.open(name) for name in names)
+
+    if coarse_factor is not None:
+        # Screens at coarse_factor times lower resolution and refines only the
+        # tiles that may have changed; the full-resolution medians are never built
+        from multires import coarse_to_fine_change_detection
+        epochs = []
+        for start_date, end_date in ((start1, end1), (start2, end2)):
+            epochs.append(filter_date(collection, start_date, end_date))
+            if not epochs[-1]:
+                raise ValueError(f"No scenes between {start_date} and {end_date}")
+        results, _ = coarse_to_fine_change_detection(
+            *epochs, aoi, grid, threshold, lee_radius, boxcar_radius, coarse_factor,
+            coarse_threshold, tile_shape or (128, 128))
+        if store is not None:
+            for name, result in zip(names, results):
+                store.put(name, result)
+        return results
+
+    image1 = _stored_median(aoi, start1, end1, catalog, grid, median_method, store, scene_ids)
+    image2 = _stored_median(aoi, start2, end2, catalog, grid, median_method, store, scene_ids)
+    if fused:
+        results = fused_change_detection(image1, image2, aoi, grid, threshold, lee_radius,
+                                         boxcar_radius, block_rows, outputs)
+    else:
+        results = _change_detection(image1, image2, aoi_mask(aoi, grid), threshold, lee_radius,
+                                    boxcar_radius, tile_shape, workers, shared_memory)
+    if store is not None:
+        for name, result in zip(names, results):
+            if result is not None:
+                store.put(name, result)
+    return results
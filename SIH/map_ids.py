@@ -0,0 +1,72 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Issues getMapId calls concurrently and remembers the results for a while, so
+# a rerun with the same expressions reuses tile URLs that are still valid.
+# Images only need getMapId(vis_params) and serialize(), so a local stand-in
+# for the Earth Engine client works as well as ee.Image.
+
+
+def expression_key(image, vis_params):
+    expression = hashlib.sha1(image.serialize().encode()).hexdigest()
+    return expression, json.dumps(vis_params, sort_keys=True)
+
+
+class MapIdCache:
+    def __init__(self, ttl_seconds=3600, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.stats['hits'] += 1
+                return entry[1]
+            self.entries.pop(key, None)
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, map_id):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl_seconds, map_id)
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache(name, **options):
+    # Lives in this module so it survives Streamlit reruns of the app script
+    with _shared_lock:
+        if name not in _shared_caches:
+            _shared_caches[name] = MapIdCache(**options)
+        return _shared_caches[name]
+
+
+def get_map_ids(requests, cache=None, max_workers=None):
+    # requests is a list of (image, vis_params); map ids come back in the same order
+    keys = [expression_key(image, vis_params) for image, vis_params in requests]
+    map_ids = [cache.get(key) if cache is not None else None for key in keys]
+    missing = {}
+    for index, (key, map_id) in enumerate(zip(keys, map_ids)):
+        if map_id is None:
+            missing.setdefault(key, []).append(index)
+    if missing:
+        with ThreadPoolExecutor(max_workers=max_workers or len(missing)) as executor:
+            futures = {key: executor.submit(requests[indices[0]][0].getMapId,
+                                            requests[indices[0]][1])
+                       for key, indices in missing.items()}
+        for key, future in futures.items():
+            map_id = future.result()
+            if cache is not None:
+                cache.put(key, map_id)
+            for index in missing[key]:
+                map_ids[index] = map_id
+    return map_ids
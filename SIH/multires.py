@@ -0,0 +1,97 @@
+import warnings
+
+import numpy as np
+
+import local_backend
+from tiling import apply_chain, chain_halo, plan_tiles
+
+# Coarse-to-fine change detection for large AOIs. Every scene is block-averaged
+# by `factor` and the whole chain runs once on the coarse medians; only tiles
+# whose coarse diff exceeds a relaxed threshold somewhere (or next to them)
+# get full-resolution medians and filtering. Refined tiles are read with the
+# filter halo, so they match a full-resolution run exactly; elsewhere the
+# outputs hold the coarse results upsampled, with no changes flagged.
+
+
+def decimate(image, factor, block_rows=1024):
+    # NaN-aware block mean; blocks on the right and bottom edges average the
+    # pixels they have. Read block_rows rows at a time, so memory-mapped scenes
+    # are streamed.
+    rows, cols = image.shape
+    out_rows, out_cols = -(-rows // factor), -(-cols // factor)
+    out = np.empty((out_rows, out_cols), dtype=np.float32)
+    step = max(block_rows // factor, 1) * factor
+    for r0 in range(0, rows, step):
+        block = np.asarray(image[r0:r0 + step], dtype=np.float32)
+        if block.shape[0] % factor or cols % factor:
+            block = np.pad(block, ((0, -block.shape[0] % factor), (0, -cols % factor)),
+                           constant_values=np.nan)
+        block = block.reshape(-1, factor, out_cols, factor)
+        means = block.mean(axis=(1, 3))
+        # Only blocks with masked pixels need the slower NaN-aware mean
+        partial = np.isnan(means)
+        if partial.any():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN blocks stay NaN
+                means[partial] = np.nanmean(block.transpose(0, 2, 1, 3)[partial], axis=(1, 2))
+        out[r0 // factor:r0 // factor + len(means)] = means
+    return out
+
+
+def _coarse_median(collection, grid, factor):
+    if not collection:
+        raise ValueError("No scenes in the collection")
+    stack = np.stack([decimate(local_backend.read_scene(scene, grid), factor)
+                      for scene in collection])
+    with np.errstate(all='ignore'):
+        return np.nanmedian(stack, axis=0).astype(np.float32)
+
+
+def _dilate(flags):
+    # Also flag the 8 neighbours of every flagged pixel
+    padded = np.pad(flags, 1)
+    rows, cols = flags.shape
+    return np.logical_or.reduce([padded[r:r + rows, c:c + cols]
+                                 for r in range(3) for c in range(3)])
+
+
+def coarse_to_fine_change_detection(collection1, collection2, aoi, grid, threshold=0.1,
+                                    lee_radius=1, boxcar_radius=1, factor=4,
+                                    coarse_threshold=None, tile_shape=(128, 128)):
+    # Returns ((image1_boxcar, image2_boxcar, diff, changes), refined) where
+    # refined lists the tiles computed at full resolution
+    if coarse_threshold is None:
+        coarse_threshold = threshold / 2
+    chain = local_backend.filter_chain(lee_radius, boxcar_radius)
+    rows, cols = grid['shape']
+    mask = local_backend.aoi_mask(aoi, grid)
+
+    coarse1 = apply_chain(chain, _coarse_median(collection1, grid, factor))
+    coarse2 = apply_chain(chain, _coarse_median(collection2, grid, factor))
+    coarse_diff = np.abs(coarse2 - coarse1)
+    with np.errstate(invalid='ignore'):
+        flags = _dilate(coarse_diff > coarse_threshold)
+
+    def upsample(image):
+        return np.repeat(np.repeat(image, factor, axis=0), factor, axis=1)[:rows, :cols]
+
+    outputs = [np.where(mask, upsample(coarse1), np.nan).astype(np.float32),
+               np.where(mask, upsample(coarse2), np.nan).astype(np.float32),
+               np.where(mask, upsample(coarse_diff), np.nan).astype(np.float32),
+               np.zeros((rows, cols), dtype=bool)]
+    refined = []
+    for tile in plan_tiles((rows, cols), tile_shape, chain_halo(chain)):
+        core_rows, core_cols = tile['core']
+        coarse_rows = slice(core_rows.start // factor, -(-core_rows.stop // factor))
+        coarse_cols = slice(core_cols.start // factor, -(-core_cols.stop // factor))
+        if not flags[coarse_rows, coarse_cols].any() or not mask[tile['core']].any():
+            continue
+        window = local_backend.grid_window(grid, tile['window'])
+        image1 = local_backend.collection_median(collection1, window)
+        image2 = local_backend.collection_median(collection2, window)
+        results = local_backend.change_detection_tile(image1, image2, mask[tile['window']], chain,
+                                                      threshold)
+        for out, result in zip(outputs, results):
+            out[tile['core']] = result[tile['inner']]
+        refined.append(tile)
+    return tuple(outputs), refined
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# On-disk store for rasters that should outlive a Streamlit rerun. Each raster
+# is split into fixed-size chunks saved as .npy files next to a JSON sidecar;
+# reads memory-map only the chunks that overlap the requested window.
+
+
+def store_key(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _chunk_part(selected, start, size):
+    # (output slice, chunk slice) of the indices in range selected that fall in
+    # the chunk covering [start, start + size), or None if there are none
+    first = max(start, selected.start)
+    first += -(first - selected.start) % selected.step
+    last = min(start + size, selected.stop)
+    if first >= last:
+        return None
+    count = len(range(first, last, selected.step))
+    offset = (first - selected.start) // selected.step
+    return slice(offset, offset + count), slice(first - start, last - start, selected.step)
+
+
+def _single(index, size):
+    # slice(i, i + 1) for an integer index, negative ones counting from the end
+    if not -size <= index < size:
+        raise IndexError(f"index {index} is out of bounds for axis with size {size}")
+    index = int(index) % size
+    return slice(index, index + 1)
+
+
+class LazyRaster:
+    def __init__(self, path, meta):
+        self.path = Path(path)
+        self.shape = tuple(meta['shape'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.chunk_shape = tuple(meta['chunk_shape'])
+        self.metadata = meta.get('metadata', {})
+        self.ndim = len(self.shape)
+
+    def _chunk(self, i, j):
+        return np.load(self.path / f"{i}_{j}.npy", mmap_mode='r')
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        index = index + (slice(None),) * (2 - len(index))
+        # Integers read a one-pixel-wide band, dropped from the result as
+        # NumPy would, rather than the whole raster
+        squeeze = tuple(isinstance(part, (int, np.integer)) for part in index)
+        if any(squeeze):
+            index = tuple(_single(part, size) if single else part
+                          for part, single, size in zip(index, squeeze, self.shape))
+            return self[index][(0 if squeeze[0] else slice(None), 0 if squeeze[1] else slice(None))]
+        if not all(isinstance(part, slice) for part in index):
+            return np.asarray(self)[index]
+        (r0, r1, rstep), (c0, c1, cstep) = (part.indices(size) for part, size in zip(index, self.shape))
+        if rstep < 0 or cstep < 0:
+            return np.asarray(self)[index]
+        out_rows, out_cols = range(r0, r1, rstep), range(c0, c1, cstep)
+        out = np.empty((len(out_rows), len(out_cols)), dtype=self.dtype)
+        chunk_rows, chunk_cols = self.chunk_shape
+        # Strided reads (decimated views) take every step-th row and column of
+        # each chunk, so only the selected pixels are copied out of the chunks
+        for i in range(r0 // chunk_rows, -(-r1 // chunk_rows)):
+            rows = _chunk_part(out_rows, i * chunk_rows, chunk_rows)
+            for j in range(c0 // chunk_cols, -(-c1 // chunk_cols)):
+                cols = _chunk_part(out_cols, j * chunk_cols, chunk_cols)
+                if rows is None or cols is None:
+                    continue
+                out[rows[0], cols[0]] = self._chunk(i, j)[rows[1], cols[1]]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[:, :]
+        return array if dtype is None else array.astype(dtype)
+
+
+class RasterStore:
+    def __init__(self, root, chunk_shape=(1024, 1024)):
+        self.root = Path(root)
+        self.chunk_shape = tuple(chunk_shape)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, name):
+        return self.root / name
+
+    def __contains__(self, name):
+        return self._path(name).with_suffix('.json').exists()
+
+    def put(self, name, array, metadata=None):
+        array = np.asarray(array)
+        path = self._path(name)
+        path.mkdir(parents=True, exist_ok=True)
+        chunk_rows, chunk_cols = self.chunk_shape
+        for i, r0 in enumerate(range(0, array.shape[0], chunk_rows)):
+            for j, c0 in enumerate(range(0, array.shape[1], chunk_cols)):
+                np.save(path / f"{i}_{j}.npy", array[r0:r0 + chunk_rows, c0:c0 + chunk_cols])
+        meta = {'shape': array.shape, 'dtype': array.dtype.str,
+                'chunk_shape': self.chunk_shape, 'metadata': metadata or {}}
+        # The sidecar goes last, so a raster is only visible once fully written
+        sidecar = path.with_suffix('.json')
+        partial = sidecar.with_suffix('.json.tmp')
+        partial.write_text(json.dumps(meta))
+        os.replace(partial, sidecar)
+        return self.open(name)
+
+    def open(self, name):
+        path = self._path(name)
+        meta = json.loads(path.with_suffix('.json').read_text())
+        return LazyRaster(path, meta)
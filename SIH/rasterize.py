@@ -0,0 +1,63 @@
+import numpy as np
+
+# Scanline rasterization onto a lat/lon grid. Shapes are first turned into
+# spans (row, start column, stop column) of pixels whose centres are inside,
+# and spans are filled with a running sum along each row, so the cost is
+# linear in pixels plus edge crossings. Masks can be kept packed to bits
+# (np.packbits along rows) and unpacked a few rows at a time.
+
+
+def polygon_rings(geometry):
+    # Rings of a GeoJSON Polygon or MultiPolygon as arrays of (lon, lat)
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+    return [np.asarray(ring, dtype=np.float64) for polygon in polygons for ring in polygon]
+
+
+def polygon_spans(rings, grid):
+    # Even-odd fill: a pixel is inside when an odd number of edges cross its
+    # row to the left of its centre
+    lon0, lat0 = grid['origin']
+    dlon, dlat = grid['pixel_size']
+    rows, cols = grid['shape']
+    # Each ring is closed here whether or not its last point repeats the first
+    edges = np.concatenate([np.column_stack([ring, np.roll(ring, -1, axis=0)]) for ring in rings])
+    x0, y0, x1, y1 = edges.T
+    low, high = np.minimum(y0, y1), np.maximum(y0, y1)
+    # Rows whose centre latitude is in [low, high) of each edge; horizontal edges cross none
+    first = np.maximum(np.floor((lat0 - high) / dlat - 0.5).astype(np.int64) + 1, 0)
+    last = np.minimum(np.floor((lat0 - low) / dlat - 0.5).astype(np.int64), rows - 1)
+    counts = np.maximum(last - first + 1, 0)
+    counts[(high - low) <= 0] = 0
+    edge = np.repeat(np.arange(len(edges)), counts)
+    row = first[edge] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    lat = lat0 - (row + 0.5) * dlat
+    x = x0[edge] + (lat - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+
+    order = np.lexsort((x, row))
+    row, x = row[order][0::2], x[order].reshape(-1, 2)
+    # A pixel centre at column c is inside when x_in <= centre < x_out
+    start = np.clip(np.ceil((x[:, 0] - lon0) / dlon - 0.5), 0, cols).astype(np.int64)
+    stop = np.clip(np.ceil((x[:, 1] - lon0) / dlon - 0.5), 0, cols).astype(np.int64)
+    return row, start, stop
+
+
+def fill_spans(row, start, stop, shape, packed=False):
+    rows, cols = shape
+    keep = stop > start
+    row, start, stop = row[keep], start[keep], stop[keep]
+    # Spans from one shape never overlap, so the running sum is 0 or 1 and
+    # fits int8, which views as bool without a copy
+    delta = np.zeros((rows, cols + 1), dtype=np.int8)
+    np.add.at(delta, (row, start), 1)
+    np.add.at(delta, (row, stop), -1)
+    mask = np.cumsum(delta[:, :cols], axis=1, dtype=np.int8).view(bool)
+    return np.packbits(mask, axis=1) if packed else mask
+
+
+def unpack_rows(bits, cols):
+    return np.unpackbits(bits, axis=1, count=cols).astype(bool)
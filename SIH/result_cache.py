@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# Two-tier cache for process_images results. The memory tier is an LRU bounded
+# by entry count and array bytes and holds any value (including ee.Image
+# objects); tuples of NumPy arrays are also written to an optional disk tier
+# bounded by total bytes, with least recently used files evicted first.
+# Streamlit serves sessions from several threads, so the memory tier and its
+# byte count are guarded by a lock; values are computed and files read and
+# written outside it.
+
+
+def normalize_key(lat, lon, radius_km, start1, end1, start2, end2, threshold=0.1, **filter_params):
+    # Resubmitting the same form should hit the cache even if the floats or
+    # date types differ slightly between reruns
+    return (round(float(lat), 6), round(float(lon), 6), round(float(radius_km), 3),
+            str(start1)[:10], str(end1)[:10], str(start2)[:10], str(end2)[:10],
+            round(float(threshold), 6), tuple(sorted(filter_params.items())))
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, tuple):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+def _storable(value):
+    return isinstance(value, tuple) and all(isinstance(item, np.ndarray) for item in value)
+
+
+class ResultCache:
+    def __init__(self, max_entries=32, max_bytes=1 << 30, directory=None, max_disk_bytes=8 << 30):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.memory_bytes = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        self.lock = threading.Lock()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / (hashlib.sha1(repr(key).encode()).hexdigest() + '.npz')
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return self.entries[key]
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                with np.load(path) as data:
+                    value = tuple(data[f'arr_{i}'] for i in range(len(data.files)))
+                os.utime(path)  # Mark as recently used for disk eviction
+            except FileNotFoundError:
+                pass  # Not stored, or evicted by another thread
+            else:
+                with self.lock:
+                    self.stats['disk_hits'] += 1
+                    self._remember(key, value)
+                return value
+        with self.lock:
+            self.stats['misses'] += 1
+        return default
+
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value)
+        if self.directory is not None and _storable(value):
+            path = self._path(key)
+            partial = path.with_suffix(f'.{threading.get_ident()}.tmp.npz')
+            np.savez(partial, *value)
+            os.replace(partial, path)
+            with self.lock:
+                self._evict_disk()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, self)
+        if value is self:
+            value = compute()
+            # Failed runs come back with None results and are not worth keeping
+            if value is not None and not (isinstance(value, tuple)
+                                         and any(item is None for item in value)):
+                self.put(key, value)
+        return value
+
+    def _remember(self, key, value):
+        # Called with the lock held
+        if key in self.entries:
+            self.memory_bytes -= _nbytes(self.entries.pop(key))
+        self.entries[key] = value
+        self.memory_bytes += _nbytes(value)
+        while self.entries and (len(self.entries) > self.max_entries
+                                or self.memory_bytes > self.max_bytes):
+            _, evicted = self.entries.popitem(last=False)
+            self.memory_bytes -= _nbytes(evicted)
+
+    def _evict_disk(self):
+        # Called with the lock held; files being written end in .tmp.npz and are skipped
+        files = sorted((path for path in self.directory.glob('*.npz')
+                        if not path.name.endswith('.tmp.npz')),
+                       key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in files)
+        for path in files:
+            if total <= self.max_disk_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.memory_bytes = 0
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache(name, **options):
+    # One cache per name for the life of the process. Streamlit reruns
+    # re-execute the app script but not the modules it imports, so this
+    # survives them.
+    with _shared_lock:
+        if name not in _shared_caches:
+            _shared_caches[name] = ResultCache(**options)
+        return _shared_caches[name]
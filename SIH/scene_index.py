@@ -0,0 +1,113 @@
+import numpy as np
+
+# Scene catalogue with a footprint and acquisition-time index. SceneIndex is
+# still a list of scene dicts, so everything that scans a catalogue keeps
+# working; filter_collection uses query() when it gets one. Footprints are
+# packed into an R-tree with Sort-Tile-Recursive (STR) packing, built per
+# (instrumentMode, polarisation) on first use, and acquisition times are kept
+# sorted so a date window is two binary searches. The index is built once from
+# the scenes given; scenes appended afterwards are not indexed.
+
+NODE_SIZE = 16
+
+
+def _str_pack(boxes, node_size=NODE_SIZE):
+    # Orders boxes so that each run of node_size is spatially compact: slice
+    # by x centre into sqrt(n / node_size) vertical strips, then sort each
+    # strip by y centre
+    n = len(boxes)
+    strips = max(int(np.ceil(np.sqrt(n / node_size))), 1)
+    x = (boxes[:, 0] + boxes[:, 2]) / 2
+    y = (boxes[:, 1] + boxes[:, 3]) / 2
+    by_x = np.argsort(x, kind='stable')
+    strip = np.empty(n, dtype=np.int64)
+    strip[by_x] = np.arange(n) * strips // max(n, 1)
+    return np.lexsort((y, strip))
+
+
+def _node_boxes(boxes, node_size=NODE_SIZE):
+    starts = np.arange(0, len(boxes), node_size)
+    return np.column_stack([np.minimum.reduceat(boxes[:, 0], starts),
+                            np.minimum.reduceat(boxes[:, 1], starts),
+                            np.maximum.reduceat(boxes[:, 2], starts),
+                            np.maximum.reduceat(boxes[:, 3], starts)])
+
+
+def _overlaps(boxes, bounds):
+    west, south, east, north = bounds
+    return ~((boxes[:, 2] < west) | (boxes[:, 0] > east)
+             | (boxes[:, 3] < south) | (boxes[:, 1] > north))
+
+
+class PackedRTree:
+    def __init__(self, boxes, node_size=NODE_SIZE):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.node_size = node_size
+        self.order = _str_pack(boxes, node_size)
+        # levels[0] holds the leaf boxes in packed order; each higher level
+        # bounds consecutive runs of node_size entries of the level below
+        self.levels = [boxes[self.order]]
+        while len(self.levels[-1]) > node_size:
+            self.levels.append(_node_boxes(self.levels[-1], node_size))
+        self.levels.reverse()
+
+    def query(self, bounds):
+        # Positions (into the boxes passed in) of the boxes overlapping bounds
+        if not len(self.levels[-1]):
+            return np.empty(0, dtype=np.int64)
+        candidates = np.arange(len(self.levels[0]))
+        for depth, level in enumerate(self.levels):
+            hits = candidates[_overlaps(level[candidates], bounds)]
+            if depth == len(self.levels) - 1:
+                return self.order[hits]
+            # Expand each hit node to its children in the next level
+            children = hits[:, None] * self.node_size + np.arange(self.node_size)
+            candidates = children[children < len(self.levels[depth + 1])]
+        return np.empty(0, dtype=np.int64)
+
+
+class SceneIndex(list):
+    def __init__(self, scenes=()):
+        super().__init__(scenes)
+        self.dates = np.array([np.datetime64(scene['date']) for scene in self],
+                              dtype='datetime64[s]')
+        self.by_date = np.argsort(self.dates, kind='stable')
+        self.sorted_dates = self.dates[self.by_date]
+        self.boxes = np.array([scene['bounds'] for scene in self], dtype=np.float64).reshape(-1, 4)
+        self.trees = {}
+
+    def _tree(self, mode, polarisation):
+        # Footprint tree over the scenes with this mode and polarisation, with
+        # their catalogue positions and a membership mask
+        key = (mode, polarisation)
+        if key not in self.trees:
+            eligible = np.array([scene['instrumentMode'] == mode
+                                 and polarisation in scene['transmitterReceiverPolarisation']
+                                 for scene in self], dtype=bool)
+            members = np.flatnonzero(eligible)
+            self.trees[key] = members, eligible, PackedRTree(self.boxes[members])
+        return self.trees[key]
+
+    def positions(self, bounds, start_date=None, end_date=None, mode='IW', polarisation='VV'):
+        # Catalogue positions, in catalogue order, of the matching scenes that
+        # overlap bounds and were acquired in [start_date, end_date)
+        members, eligible, tree = self._tree(mode, polarisation)
+        if start_date is None and end_date is None:
+            positions = members[tree.query(bounds)]
+        else:
+            start = np.datetime64(start_date if start_date is not None else '0001-01-01', 's')
+            end = np.datetime64(end_date if end_date is not None else '9999-12-31', 's')
+            low, high = np.searchsorted(self.sorted_dates, [start, end])
+            if (high - low) * 4 < len(members):
+                # A narrow window is cheaper to check directly than the tree
+                window = self.by_date[low:high]
+                window = window[eligible[window]]
+                positions = window[_overlaps(self.boxes[window], bounds)]
+            else:
+                positions = members[tree.query(bounds)]
+                dates = self.dates[positions]
+                positions = positions[(dates >= start) & (dates < end)]
+        return np.sort(positions)
+
+    def query(self, bounds, start_date=None, end_date=None, mode='IW', polarisation='VV'):
+        return [self[i] for i in self.positions(bounds, start_date, end_date, mode, polarisation)]
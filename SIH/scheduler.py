@@ -0,0 +1,183 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from tiling import plan_tiles, read_windows, run_window
+
+# Farms tiles out to a process pool. At most max_pending tiles are read and in
+# flight at once, so memory stays bounded however many tiles the scene has.
+# A tile that raises is reported with its error and the remaining tiles carry on.
+# In shared mode the rasters live in shared memory and workers are sent only
+# handles and the tile slices, instead of pickled windows and results; rasters
+# allocated in a SharedArrays in the first place need no copy in or out.
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _attach(handles):
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in handles]
+    arrays = [np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+              for shm, (_, shape, dtype) in zip(blocks, handles)]
+    return blocks, arrays
+
+
+def _release(blocks, arrays, unlink=False):
+    # The views must go before their buffers can be closed
+    arrays.clear()
+    for shm in blocks:
+        shm.close()
+        if unlink:
+            shm.unlink()
+
+
+def _run_shared_tile(func, input_handles, output_handles, tile):
+    blocks, arrays = _attach(input_handles + output_handles)
+    try:
+        results = run_window(func, read_windows(arrays[:len(input_handles)], tile), tile['inner'])
+        for out, result in zip(arrays[len(input_handles):], results):
+            out[tile['core']] = result
+    finally:
+        _release(blocks, arrays)
+
+
+def schedule_calls(calls, workers=None, ordered=True, max_pending=None):
+    # calls yields (tag, function, args); yields (tag, result, error). Tags are
+    # tiles here, but any per-task label works.
+    workers = workers or default_workers()
+    max_pending = max_pending or 2 * workers
+    calls = iter(calls)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}  # future -> tile, in submission order
+        while True:
+            while len(pending) < max_pending:
+                call = next(calls, None)
+                if call is None:
+                    break
+                tile, function, args = call
+                pending[executor.submit(function, *args)] = tile
+            if not pending:
+                return
+            if ordered:
+                done = [next(iter(pending))]
+                wait(done)
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                tile = pending.pop(future)
+                error = future.exception()
+                yield tile, None if error else future.result(), error
+
+
+def schedule_tiles(func, inputs, tiles, workers=None, ordered=True, max_pending=None):
+    # Yields (tile, results, error) with exactly one of results/error set.
+    # func must be picklable, i.e. a module-level function or a partial of one.
+    calls = ((tile, run_window, (func, read_windows(inputs, tile), tile['inner']))
+             for tile in tiles)
+    return schedule_calls(calls, workers, ordered, max_pending)
+
+
+def schedule_shared_tiles(func, input_handles, output_handles, tiles, workers=None,
+                          ordered=True, max_pending=None):
+    # Handles are (shared memory name, shape, dtype). Workers write each tile's
+    # core straight into the shared outputs, so only errors come back.
+    calls = ((tile, _run_shared_tile, (func, input_handles, output_handles, tile))
+             for tile in tiles)
+    return schedule_calls(calls, workers, ordered, max_pending)
+
+
+def execute_tiles_parallel(func, inputs, tile_shape, halo, outputs, workers=None,
+                           ordered=False, max_pending=None, shared=False):
+    # shared may be True, or a SharedArrays holding some of the inputs and outputs
+    tiles = plan_tiles(inputs[0].shape, tile_shape, halo)
+    if shared:
+        return _execute_shared(func, inputs, tiles, outputs, workers, ordered, max_pending,
+                               shared if isinstance(shared, SharedArrays) else None)
+    errors = []
+    for tile, results, error in schedule_tiles(func, inputs, tiles, workers, ordered, max_pending):
+        if error is not None:
+            errors.append((tile, error))
+            continue
+        for out, result in zip(outputs, results):
+            out[tile['core']] = result
+    return errors
+
+
+class SharedArrays:
+    # Arrays allocated in shared memory. Passed as execute_tiles_parallel's
+    # shared argument, the inputs and outputs it owns go to workers as handles,
+    # with no copy in or out. Use as a context manager to free them; views
+    # still held afterwards keep their mapping until they are dropped.
+    def __init__(self):
+        self.blocks = []
+        self.handles = {}  # id(array) -> (shared memory name, shape, dtype)
+        self.arrays = []
+
+    def empty(self, shape, dtype=np.float32):
+        dtype = np.dtype(dtype)
+        shape = tuple(shape)
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.blocks.append(shm)
+        self.arrays.append(array)
+        self.handles[id(array)] = (shm.name, shape, dtype.str)
+        return array
+
+    def full(self, shape, value, dtype=np.float32):
+        array = self.empty(shape, dtype)
+        array[...] = value
+        return array
+
+    def copy(self, source):
+        source = np.asarray(source)
+        array = self.empty(source.shape, source.dtype)
+        array[...] = source
+        return array
+
+    def handle(self, array):
+        return self.handles.get(id(array))
+
+    def close(self):
+        self.handles.clear()
+        self.arrays.clear()
+        for shm in self.blocks:
+            shm.unlink()
+            try:
+                shm.close()
+            except BufferError:
+                pass  # A caller still holds a view; the mapping goes with it
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _execute_shared(func, inputs, tiles, outputs, workers, ordered, max_pending, owner=None):
+    # Rasters owned by owner are passed as they are. Any other raster is
+    # copied into shared memory once, instead of being pickled tile by tile,
+    # and such outputs are copied back, starting from the caller's fill values.
+    with SharedArrays() as scratch:
+        def share(array):
+            if owner is not None and owner.handle(array) is not None:
+                return owner.handle(array), None
+            copy = scratch.copy(array)
+            return scratch.handle(copy), copy
+
+        input_handles = [share(array)[0] for array in inputs]
+        shared_outputs = [share(out) for out in outputs]
+        errors = [(tile, error) for tile, _, error in
+                  schedule_shared_tiles(func, input_handles,
+                                        [handle for handle, _ in shared_outputs], tiles,
+                                        workers, ordered, max_pending)
+                  if error is not None]
+        for out, (_, copy) in zip(outputs, shared_outputs):
+            if copy is not None:
+                out[...] = copy
+        return errors
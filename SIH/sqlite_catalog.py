@@ -0,0 +1,187 @@
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import local_backend
+
+# Scene metadata in SQLite, answering the filterBounds / filterDate / IW / VV
+# query of load_image_collection with indexes instead of a scan. Footprints go
+# into an R*Tree virtual table when the SQLite build has one, and the exact
+# bounds test is repeated on the scene row, since the R*Tree stores rounded
+# (outward) 32-bit coordinates. Scenes come back as the same dicts as
+# read_catalog, in ingest order, with data paths relative to the database.
+#
+#   python sqlite_catalog.py catalog.jsonl catalog.sqlite
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    instrument_mode TEXT NOT NULL,
+    orbit_pass TEXT,
+    relative_orbit INTEGER,
+    west REAL NOT NULL,
+    south REAL NOT NULL,
+    east REAL NOT NULL,
+    north REAL NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS polarisations (
+    scene INTEGER NOT NULL,
+    polarisation TEXT NOT NULL
+);
+"""
+
+# Created after the first bulk insert, which is much faster than maintaining them row by row
+INDEXES = """
+CREATE INDEX IF NOT EXISTS scenes_mode_date ON scenes (instrument_mode, date);
+CREATE INDEX IF NOT EXISTS scenes_date ON scenes (date);
+CREATE INDEX IF NOT EXISTS scenes_orbit ON scenes (relative_orbit, orbit_pass, date);
+CREATE INDEX IF NOT EXISTS polarisations_polarisation ON polarisations (polarisation, scene);
+CREATE INDEX IF NOT EXISTS polarisations_scene ON polarisations (scene, polarisation);
+"""
+
+SPATIAL = "CREATE VIRTUAL TABLE IF NOT EXISTS scene_bounds USING rtree(id, west, east, south, north)"
+
+
+def _timestamp(value):
+    # Fixed-width ISO strings sort in time order
+    return str(np.datetime64(value, 's'))
+
+
+class SQLiteCatalog:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.local = threading.local()
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        try:
+            connection.execute(SPATIAL)
+            self.spatial = True
+        except sqlite3.OperationalError:
+            # No R*Tree module; the bounds columns are filtered directly
+            self.spatial = False
+        connection.commit()
+
+    def _connection(self):
+        # One connection per thread; Streamlit serves sessions from several
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = sqlite3.connect(self.path)
+        return connection
+
+    def __len__(self):
+        return self._connection().execute("SELECT count(*) FROM scenes").fetchone()[0]
+
+    def __iter__(self):
+        rows = self._connection().execute("SELECT record FROM scenes ORDER BY rowid")
+        return iter(self._scenes(rows))
+
+    def _scenes(self, rows):
+        return [local_backend._scene_from_json(json.loads(record), self.path.parent)
+                for record, in rows]
+
+    def ingest(self, records, root=None, batch_size=10000):
+        # records as in a JSON lines catalogue, with data paths relative to root.
+        # Scenes whose id is already present are skipped.
+        root = Path(root) if root is not None else self.path.parent
+        prefix = os.path.relpath(os.path.abspath(root), os.path.abspath(self.path.parent))
+        records = iter(records)
+
+        def rows():
+            while True:
+                batch = [dict(record) for record in itertools.islice(records, batch_size)]
+                if not batch:
+                    return
+                # Parsed and formatted per batch rather than per record
+                dates = np.array([record['date'] for record in batch], dtype='datetime64[s]')
+                for record, date in zip(batch, dates.astype(str)):
+                    record['data'] = os.path.normpath(os.path.join(prefix, record['data']))
+                    west, south, east, north = record['bounds']
+                    yield (record['id'], date, record['instrumentMode'],
+                           record.get('orbitProperties_pass'),
+                           record.get('relativeOrbitNumber_start'),
+                           west, south, east, north, json.dumps(record))
+
+        connection = self._connection()
+        with connection:
+            last = connection.execute("SELECT coalesce(max(rowid), 0) FROM scenes").fetchone()[0]
+            connection.executemany(
+                "INSERT OR IGNORE INTO scenes (id, date, instrument_mode, orbit_pass, relative_orbit,"
+                " west, south, east, north, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows())
+            # Polarisations and footprints of the new rows, in bulk inside SQLite
+            connection.execute(
+                "INSERT INTO polarisations SELECT scenes.rowid, value FROM scenes,"
+                " json_each(scenes.record, '$.transmitterReceiverPolarisation')"
+                " WHERE scenes.rowid > ?", (last,))
+            if self.spatial:
+                connection.execute(
+                    "INSERT INTO scene_bounds SELECT rowid, west, east, south, north FROM scenes"
+                    " WHERE rowid > ?", (last,))
+            added = connection.execute("SELECT count(*) FROM scenes WHERE rowid > ?",
+                                       (last,)).fetchone()[0]
+        connection.executescript(INDEXES)
+        connection.execute("ANALYZE")
+        return added
+
+    def query(self, bounds, start_date=None, end_date=None, mode='IW', polarisation='VV',
+              relative_orbit=None, orbit_pass=None):
+        west, south, east, north = bounds
+        clauses = ["scenes.instrument_mode = ?",
+                   "EXISTS (SELECT 1 FROM polarisations"
+                   " WHERE scene = scenes.rowid AND polarisation = ?)",
+                   "scenes.west <= ? AND scenes.east >= ? AND scenes.south <= ? AND scenes.north >= ?"]
+        parameters = [mode, polarisation, east, west, north, south]
+        if self.spatial:
+            # CROSS JOIN keeps the R*Tree as the driving table
+            source = "scene_bounds CROSS JOIN scenes ON scenes.rowid = scene_bounds.id"
+            clauses.append("scene_bounds.west <= ? AND scene_bounds.east >= ?"
+                           " AND scene_bounds.south <= ? AND scene_bounds.north >= ?")
+            parameters += [east, west, north, south]
+        else:
+            source = "scenes"
+        if start_date is not None:
+            clauses.append("scenes.date >= ?")
+            parameters.append(_timestamp(start_date))
+        if end_date is not None:
+            clauses.append("scenes.date < ?")
+            parameters.append(_timestamp(end_date))
+        if relative_orbit is not None:
+            clauses.append("scenes.relative_orbit = ?")
+            parameters.append(int(relative_orbit))
+        if orbit_pass is not None:
+            clauses.append("scenes.orbit_pass = ?")
+            parameters.append(orbit_pass)
+        rows = self._connection().execute(
+            f"SELECT scenes.record FROM {source} WHERE " + " AND ".join(clauses)
+            + " ORDER BY scenes.rowid", parameters)
+        return self._scenes(rows)
+
+
+def build_catalog(source, path):
+    source = Path(source)
+    catalog = SQLiteCatalog(path)
+    with open(source) as lines:
+        added = catalog.ingest((json.loads(line) for line in lines if line.strip()), source.parent)
+    return catalog, added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a JSON lines scene catalogue into SQLite")
+    parser.add_argument('source', help="JSON lines scene catalogue")
+    parser.add_argument('database', help="SQLite file to create or extend")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    catalog, added = build_catalog(args.source, args.database)
+    print(f"Added {added} scenes ({len(catalog)} total) in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
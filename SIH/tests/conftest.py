@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The app modules are flat scripts in SIH/ that import each other by name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import benchmarks  # noqa: E402
+
+# Two epochs of three synthetic scenes each (one scene every 6 days from 2024-01-01)
+EPOCHS = ('2024-01-01', '2024-01-19', '2024-01-19', '2024-02-06')
+
+
+@pytest.fixture
+def scene_records():
+    # A catalogue's worth of JSON scene records with random footprints,
+    # acquisition times, modes, polarisations and orbits
+    rng = np.random.default_rng(0)
+    n = 1500
+    west = rng.uniform(70, 90, n)
+    south = rng.uniform(10, 30, n)
+    width, height = rng.uniform(0.05, 2.5, (2, n))
+    times = np.datetime64('2023-01-01T00:00:00') + rng.integers(0, 730 * 86400, n).astype('m8[s]')
+    polarisations = [['VV', 'VH'], ['VV'], ['HH', 'HV'], ['VH']]
+    return [{'id': f'S1_{i:05d}', 'date': str(times[i]),
+             'instrumentMode': 'IW' if rng.random() < 0.8 else 'EW',
+             'transmitterReceiverPolarisation': polarisations[rng.integers(len(polarisations))],
+             'orbitProperties_pass': 'ASCENDING' if i % 2 else 'DESCENDING',
+             'relativeOrbitNumber_start': int(rng.integers(1, 10)),
+             'bounds': [west[i], south[i], west[i] + width[i], south[i] + height[i]],
+             'grid': {'origin': [west[i], south[i] + height[i]], 'pixel_size': [1e-3, 1e-3],
+                      'shape': [10, 10]},
+             'data': f'scenes/S1_{i:05d}.npy'}
+            for i in range(n)]
+
+
+@pytest.fixture
+def make_collection():
+    # (collection, grid) of speckled scenes covering the whole grid
+    def make(shape=(48, 40), scenes=6, seed=0):
+        grid = benchmarks.synthetic_grid(shape)
+        stack = benchmarks.speckled_stack(scenes, shape, seed=seed)
+        return benchmarks.synthetic_collection(stack, grid), grid
+    return make
+
+
+@pytest.fixture
+def epochs():
+    return EPOCHS
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import aoi_geometry
+from local_backend import EARTH_RADIUS_M
+
+
+def _haversine_m(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    h = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(h))
+
+
+CENTRES = [(77.0, 20.0), (-179.99, 65.0), (179.995, -33.0), (12.5, 0.0), (0.0, 84.0)]
+RADII = [50.0, 2500.0, 150000.0]
+
+
+@pytest.mark.parametrize('radius_m', RADII)
+def test_vertices_lie_on_the_radius(radius_m):
+    lons, lats = zip(*CENTRES)
+    rings = aoi_geometry.geodesic_buffers(lons, lats, radius_m, vertices=48)
+    assert rings.shape == (len(CENTRES), 49, 2)
+    for (lon, lat), ring in zip(CENTRES, rings):
+        np.testing.assert_array_equal(ring[0], ring[-1])
+        assert ((ring[:, 0] >= -180) & (ring[:, 0] < 180)).all()
+        distances = _haversine_m(lon, lat, ring[:, 0], ring[:, 1])
+        np.testing.assert_allclose(distances, radius_m, rtol=1e-9)
+
+
+@pytest.mark.parametrize('radius_m', RADII)
+def test_rings_wind_counter_clockwise(radius_m):
+    lons, lats = zip(*CENTRES)
+    for (lon, lat), ring in zip(CENTRES, aoi_geometry.geodesic_buffers(lons, lats, radius_m)):
+        # Unwrapped around the centre, so rings across the antimeridian stay whole
+        x = (ring[:, 0] - lon + 180) % 360 - 180
+        y = ring[:, 1] - lat
+        signed_area = np.sum(x[:-1] * y[1:] - x[1:] * y[:-1]) / 2
+        assert signed_area > 0
+
+
+def test_buffer_geojson_reuses_snapped_rings():
+    aoi_geometry._buffer_ring.cache_clear()
+    first = aoi_geometry.buffer_geojson(77.1234567, 20.7654321, 12.3456)
+    # Within the snapping steps of the first request
+    second = aoi_geometry.buffer_geojson(77.12345674, 20.76543206, 12.34563)
+    info = aoi_geometry._buffer_ring.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+    assert first == second
+    aoi_geometry.buffer_geojson(77.1234587, 20.7654321, 12.3456)
+    assert aoi_geometry._buffer_ring.cache_info().misses == 2
+    ring = first['features'][0]['geometry']['coordinates'][0]
+    assert len(ring) == 65 and ring[0] == ring[-1]
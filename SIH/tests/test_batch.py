@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+
+import batch
+
+
+def test_threshold_defaults_only_when_blank():
+    assert batch._threshold({}) == 0.1
+    assert batch._threshold({'threshold': ''}) == 0.1
+    assert batch._threshold({'threshold': None}) == 0.1
+    assert batch._threshold({'threshold': '0'}) == 0.0
+    assert batch._threshold({'threshold': 0}) == 0.0
+    assert batch._threshold({'threshold': '0.25'}) == 0.25
+
+
+def test_raster_names_stay_in_the_output_directory():
+    assert batch._raster_name('site-12_a.b') == 'site-12_a.b.npz'
+    assert batch._raster_name(7) == '7.npz'
+    names = [batch._raster_name(aoi_id) for aoi_id in
+             ['../../etc/passwd', '/abs/path', '..', '.hidden', 'a/b', 'a_b', 'a\\b', '']]
+    for name in names:
+        assert '/' not in name and '\\' not in name and not name.startswith('.')
+    assert len(set(names)) == len(names)
+
+
+def test_run_aoi_writes_sanitized_rasters(tmp_path, make_collection, epochs):
+    collection, _ = make_collection((40, 40))
+    (tmp_path / 'scenes').mkdir()
+    with open(tmp_path / 'catalog.jsonl', 'w') as catalog:
+        for scene in collection:
+            np.save(tmp_path / 'scenes' / f"{scene['id']}.npy", scene['data'])
+            record = dict(scene, data=f"scenes/{scene['id']}.npy")
+            catalog.write(json.dumps(record) + '\n')
+    out = tmp_path / 'out'
+    out.mkdir()
+    record = dict(zip(['start1', 'end1', 'start2', 'end2'], epochs), id='../escaped',
+                  lat=19.998, lon=77.002, radius_km=0.15, threshold='0')
+    result = batch.run_aoi(record, str(tmp_path / 'catalog.jsonl'), str(out), True, {})
+    assert not (tmp_path / 'escaped.npz').exists()
+    with np.load(out / result['rasters']) as rasters:
+        changes = rasters['changes']
+    # A zero threshold flags every pixel with any difference
+    assert result['changed_pixels'] == np.count_nonzero(changes) > 0
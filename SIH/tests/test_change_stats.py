@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import benchmarks
+import change_stats
+import local_backend
+from tiling import plan_tiles
+
+
+def _diff_and_changes(shape=(45, 38), seed=0):
+    rng = np.random.default_rng(seed)
+    diff = rng.gamma(1.0, 1.5, size=shape).astype(np.float32)
+    diff[rng.random(shape) < 0.15] = np.nan
+    diff[0, :5] = 12.0  # Beyond the histogram range
+    return diff, diff > 2.0
+
+
+def test_change_statistics_match_direct_sums():
+    # Half a degree pixels, so pixel areas vary down the grid
+    grid = benchmarks.synthetic_grid((45, 38), pixel_size=0.5, origin=(70.0, 40.0))
+    diff, changes = _diff_and_changes()
+    statistics = change_stats.change_statistics(diff, changes, grid, tile_shape=(16, 16))
+
+    lat = 40.0 - 0.5 * np.arange(46)
+    row_area = (local_backend.EARTH_RADIUS_M ** 2 * np.radians(0.5)
+                * (np.sin(np.radians(lat[:-1])) - np.sin(np.radians(lat[1:]))))
+    valid = ~np.isnan(diff)
+    changed_area = sum(row_area[r] for r in np.nonzero(valid & changes)[0])
+    valid_area = sum(row_area[r] for r in np.nonzero(valid)[0])
+    assert statistics['changed_pixels'] == int((valid & changes).sum())
+    assert statistics['valid_pixels'] == int(valid.sum())
+    assert statistics['changed_area_km2'] == pytest.approx(changed_area / 1e6, rel=1e-9)
+    assert statistics['valid_area_km2'] == pytest.approx(valid_area / 1e6, rel=1e-9)
+    assert statistics['changed_fraction'] == pytest.approx(changed_area / valid_area, rel=1e-9)
+    assert statistics['mean_diff'] == pytest.approx(np.nanmean(diff, dtype=np.float64), rel=1e-9)
+    assert statistics['mean_diff_changed'] == pytest.approx(
+        np.mean(diff[valid & changes], dtype=np.float64), rel=1e-9)
+    assert statistics['histogram'].sum() == valid.sum()
+    # Values beyond the range land in the last bin
+    assert statistics['histogram'][1, -1] >= 5
+
+
+def test_merged_tiles_equal_one_tile():
+    grid = benchmarks.synthetic_grid((45, 38))
+    diff, changes = _diff_and_changes(seed=1)
+    area = local_backend.pixel_area_m2(grid)
+    whole = change_stats.tile_statistics(diff, changes, area)
+    parts = [change_stats.tile_statistics(diff[tile['core']], changes[tile['core']],
+                                          area[tile['core'][0]])
+             for tile in plan_tiles(diff.shape, (7, 5), 0)]
+    merged = change_stats.merge_statistics(parts)
+    np.testing.assert_array_equal(merged['histogram'], whole['histogram'])
+    np.testing.assert_allclose(merged['area_histogram'], whole['area_histogram'], rtol=1e-12)
+    np.testing.assert_allclose(merged['diff_sum'], whole['diff_sum'], rtol=1e-12)
+
+
+def test_parallel_statistics_equal_serial():
+    grid = benchmarks.synthetic_grid((45, 38))
+    diff, changes = _diff_and_changes(seed=2)
+    serial = change_stats.change_statistics(diff, changes, grid, tile_shape=(10, 10))
+    parallel = change_stats.change_statistics(diff, changes, grid, tile_shape=(10, 10), workers=2)
+    assert serial.keys() == parallel.keys()
+    for name, value in serial.items():
+        if isinstance(value, np.ndarray):
+            np.testing.assert_allclose(parallel[name], value, rtol=1e-12)
+        else:
+            assert parallel[name] == pytest.approx(value, rel=1e-12)
+
+
+def test_all_masked_statistics():
+    grid = benchmarks.synthetic_grid((4, 3))
+    diff = np.full((4, 3), np.nan, dtype=np.float32)
+    statistics = change_stats.change_statistics(diff, np.zeros((4, 3), bool), grid)
+    assert statistics['valid_pixels'] == 0 and statistics['changed_area_km2'] == 0
+    assert statistics['mean_diff'] is None and statistics['changed_fraction'] is None
@@ -0,0 +1,87 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+import benchmarks
+import components
+
+
+def _flood_fill(mask, connectivity):
+    neighbours = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    if connectivity == 8:
+        neighbours += [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+    rows, cols = mask.shape
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    count = 0
+    for r, c in zip(*np.nonzero(mask)):
+        if labels[r, c]:
+            continue
+        count += 1
+        labels[r, c] = count
+        queue = deque([(r, c)])
+        while queue:
+            r0, c0 = queue.popleft()
+            for dr, dc in neighbours:
+                r1, c1 = r0 + dr, c0 + dc
+                if 0 <= r1 < rows and 0 <= c1 < cols and mask[r1, c1] and not labels[r1, c1]:
+                    labels[r1, c1] = count
+                    queue.append((r1, c1))
+    return labels, count
+
+
+def _assert_same_partition(labels, expected):
+    # Same background and a one-to-one map between the two numberings
+    assert np.array_equal(labels > 0, expected > 0)
+    pairs = np.unique(np.column_stack([labels[labels > 0], expected[expected > 0]]), axis=0)
+    assert len(np.unique(pairs[:, 0])) == len(pairs) == len(np.unique(pairs[:, 1]))
+
+
+def test_union_find_roots_are_smallest_members():
+    u = np.array([5, 1, 3, 7, 2])
+    v = np.array([1, 3, 0, 8, 9])
+    roots = components._union_find(10, u, v)
+    np.testing.assert_array_equal(roots, [0, 0, 2, 0, 4, 0, 6, 7, 7, 2])
+
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('tile_shape', [None, (7, 5), (16, 1), (1, 16)])
+def test_labels_match_flood_fill(connectivity, tile_shape):
+    rng = np.random.default_rng(connectivity)
+    for density in (0.3, 0.55, 0.75):
+        mask = rng.random((37, 29)) < density
+        expected, expected_count = _flood_fill(mask, connectivity)
+        labels, count = components.label_components(mask, tile_shape, connectivity)
+        assert count == expected_count
+        _assert_same_partition(labels, expected)
+        assert set(np.unique(labels[labels > 0])) == set(range(1, count + 1))
+
+
+def test_seams_merge_diagonal_neighbours_only_with_8_connectivity():
+    mask = np.zeros((8, 8), dtype=bool)
+    mask[3, 3] = mask[4, 4] = True  # Touching corners across both seams of 4x4 tiles
+    assert components.label_components(mask, (4, 4), 4)[1] == 2
+    labels, count = components.label_components(mask, (4, 4), 8)
+    assert count == 1 and labels[3, 3] == labels[4, 4] == 1
+
+
+def test_component_stats():
+    grid = benchmarks.synthetic_grid((6, 8))
+    mask = np.zeros((6, 8), dtype=bool)
+    mask[1:3, 2:5] = True
+    mask[5, 7] = True
+    labels, count = components.label_components(mask, (3, 3))
+    stats = components.component_stats(labels, count, grid)
+    np.testing.assert_array_equal(stats['pixels'], [6, 1])
+    np.testing.assert_array_equal(stats['bbox'], [[1, 2, 3, 5], [5, 7, 6, 8]])
+    lon0, lat0 = grid['origin']
+    np.testing.assert_allclose(stats['centroid'][1], [lon0 + 7.5e-4, lat0 - 5.5e-4])
+    assert stats['area_m2'][0] > 6 * stats['area_m2'][1] * 0.99
+
+
+def test_workers_label_tile_slices():
+    mask = np.random.default_rng(3).random((40, 40)) < 0.6
+    serial = components.label_components(mask, (16, 16), 8)
+    parallel = components.label_components(mask, (16, 16), 8, workers=2)
+    assert parallel[1] == serial[1]
+    np.testing.assert_array_equal(parallel[0], serial[0])
@@ -0,0 +1,88 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import benchmarks
+import incremental
+import local_backend
+
+
+def _nanmedian(images):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmedian(np.stack(images), axis=0)
+
+
+@pytest.mark.parametrize('max_pending', [1, 3, 8])
+def test_incremental_median_matches_brute_force(max_pending):
+    rng = np.random.default_rng(max_pending)
+    images = list(benchmarks.speckled_stack(20, (9, 7), seed=max_pending))
+    for image in images:
+        image[rng.random(image.shape) < 0.25] = np.nan
+    median = incremental.IncrementalMedian((9, 7), images[:4], max_pending)
+    np.testing.assert_allclose(median.median(), _nanmedian(images[:4]), rtol=1e-6)
+    for n, image in enumerate(images[4:], start=5):
+        median.add(image)
+        assert len(median) == n
+        np.testing.assert_allclose(median.median(), _nanmedian(images[:n]), rtol=1e-6)
+
+
+@pytest.mark.parametrize('max_pending', [1, 3, 8])
+def test_incremental_median_remove(max_pending):
+    rng = np.random.default_rng(max_pending)
+    images = list(benchmarks.speckled_stack(24, (9, 7), seed=max_pending))
+    for image in images:
+        image[rng.random(image.shape) < 0.25] = np.nan
+    images[5] = images[3].copy()  # Duplicate values are removed once
+    median = incremental.IncrementalMedian((9, 7), images[:6], max_pending)
+    held = list(range(6))
+    # A sliding window: two in, one out, until the oldest ones leave faster
+    for n in range(6, 24):
+        median.add(images[n])
+        held.append(n)
+        if n % 2 or n > 18:
+            median.remove(images[held.pop(0)])
+        assert len(median) == len(held)
+        np.testing.assert_allclose(median.median(), _nanmedian([images[i] for i in held]),
+                                   rtol=1e-6)
+    # The stacks shrink with the acquisitions held
+    assert len(median.base) + len(median.pending) <= len(held) + max_pending
+    while held:
+        median.remove(images[held.pop()])
+    assert len(median) == 0 and np.isnan(median.median()).all()
+
+
+def test_incremental_median_of_nothing_is_nan():
+    assert np.isnan(incremental.IncrementalMedian((2, 3)).median()).all()
+
+
+def test_rolling_median_matches_temporal_median():
+    grid = benchmarks.synthetic_grid((12, 10))
+    stack = benchmarks.speckled_stack(15, (12, 10))
+    stack[np.random.default_rng(4).random(stack.shape) < 0.2] = np.nan
+    # One scene every 6 days from 2024-01-01
+    collection = benchmarks.synthetic_collection(stack, grid)
+    windows = list(incremental.rolling_median(collection, '2024-01-01', '2024-03-31', 20, 7, grid))
+    assert len(windows) == 11
+    for start, end, median in windows:
+        scenes = local_backend.filter_date(collection, start, end)
+        if scenes:
+            expected = local_backend.temporal_median(collection, start, end, grid)
+        else:
+            expected = np.full(grid['shape'], np.nan, dtype=np.float32)
+        np.testing.assert_allclose(median, expected, rtol=1e-6)
+
+
+def test_rolling_median_add_and_remove():
+    images = benchmarks.speckled_stack(6, (4, 5))
+    images[2, 1, 1] = np.nan
+    rolling = incremental.RollingMedian((4, 5), 4)
+    for image in images[:4]:
+        rolling.add(image)
+    with pytest.raises(ValueError):
+        rolling.add(images[4])
+    rolling.remove(images[0])
+    rolling.remove(images[2])
+    rolling.add(images[5])
+    np.testing.assert_allclose(rolling.median(), _nanmedian(images[[1, 3, 5]]), rtol=1e-6)
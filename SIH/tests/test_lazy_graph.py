@@ -0,0 +1,21 @@
+import numpy as np
+
+import lazy_graph
+import local_backend
+
+
+def test_graph_keeps_only_shared_values(make_collection, epochs):
+    collection, grid = make_collection((60, 50))
+    aoi = {'center': (77.0025, 19.997), 'radius_m': 200}
+    graph = lazy_graph.Graph()
+    outputs = lazy_graph.process_images(aoi, *epochs, collection, grid, graph=graph)
+    assert {key[0] for key in graph.values} == {'collection', 'scenes', 'median'}
+    assert not graph.pending
+
+    again = lazy_graph.process_images(aoi, *epochs, collection, grid, graph=graph)
+    assert graph.evaluations['median'] == 2
+    for first, second in zip(outputs, again):
+        np.testing.assert_array_equal(first, second)
+    expected = local_backend.process_images(aoi, *epochs, collection, grid)
+    for output, reference in zip(outputs, expected):
+        np.testing.assert_allclose(output, np.asarray(reference), atol=1e-5)
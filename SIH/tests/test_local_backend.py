@@ -0,0 +1,241 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import benchmarks
+import local_backend
+import result_cache
+from scene_index import SceneIndex
+
+
+def _offset_scene(data, grid, cols):
+    # A scene on the same lattice as grid, shifted east by cols pixels
+    lon, lat = grid['origin']
+    shifted = dict(grid, origin=(lon + cols * grid['pixel_size'][0], lat))
+    return {'id': 'offset', 'grid': shifted, 'data': data}
+
+
+def test_read_scene_pads_partial_overlap_lazily():
+    grid = benchmarks.synthetic_grid((40, 30))
+    data = np.arange(40 * 30, dtype=np.float32).reshape(40, 30)
+    window = local_backend.read_scene(_offset_scene(data, grid, 10), grid)
+    assert isinstance(window, local_backend.PaddedWindow)
+    full = np.asarray(window)
+    assert np.isnan(full[:, :10]).all()
+    np.testing.assert_array_equal(full[:, 10:], data[:, :-10])
+    np.testing.assert_array_equal(window[5:9, 8:14], full[5:9, 8:14])
+    np.testing.assert_array_equal(window[3], full[3])
+
+
+def test_collection_median_with_offset_scenes():
+    grid = benchmarks.synthetic_grid((50, 40))
+    stack = benchmarks.speckled_stack(5, (50, 40))
+    collection = benchmarks.synthetic_collection(stack[:3], grid)
+    collection += [_offset_scene(scene, grid, 7) for scene in stack[3:]]
+    expected_stack = stack.copy()
+    expected_stack[3:, :, 7:] = stack[3:, :, :-7]
+    expected_stack[3:, :, :7] = np.nan
+    expected = np.nanmedian(expected_stack, axis=0)
+    median = local_backend.collection_median(collection, grid, max_bytes=4096)
+    np.testing.assert_allclose(median, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize('method', ['histogram', 'histogram-single-pass'])
+def test_histogram_median_within_half_a_bin(method):
+    grid = benchmarks.synthetic_grid((30, 20))
+    rng = np.random.default_rng(2)
+    for scenes in (1, 2, 5, 8):
+        stack = benchmarks.speckled_stack(scenes, (30, 20), seed=scenes)
+        stack[rng.random(stack.shape) < 0.3] = np.nan
+        collection = benchmarks.synthetic_collection(stack, grid)
+        exact = local_backend.collection_median(collection, grid)
+        approx = local_backend.collection_median(collection, grid, max_bytes=4096,
+                                                 method=method, bins=600)
+        np.testing.assert_array_equal(np.isnan(approx), np.isnan(exact))
+        assert np.nanmax(np.abs(approx - exact)) <= 60 / 600 / 2 + 1e-5
+
+
+def test_process_images_caches_polygon_aois(make_collection, epochs):
+    collection, grid = make_collection((40, 40))
+    polygon = {'type': 'Polygon', 'coordinates': [[[77.0005, 19.9995], [77.0033, 19.9991],
+                                                   [77.0021, 19.9968], [77.0005, 19.9995]]]}
+    cache = result_cache.ResultCache()
+    first = local_backend.process_images(polygon, *epochs, collection, grid, cache=cache)
+    second = local_backend.process_images(polygon, *epochs, collection, grid, cache=cache)
+    assert cache.stats == {'memory_hits': 1, 'disk_hits': 0, 'misses': 1}
+    assert all(a is b for a, b in zip(first, second))
+    mask = local_backend.aoi_mask(polygon, grid)
+    assert mask.any() and np.isnan(first[2][~mask]).all()
+
+
+class _RecordingIndex(SceneIndex):
+    # A SceneIndex that records the date window of every query
+    def __init__(self, scenes, queries):
+        super().__init__(scenes)
+        self.queries = queries
+
+    def query(self, bounds, start_date=None, end_date=None, **filters):
+        self.queries.append((start_date, end_date))
+        return super().query(bounds, start_date, end_date, **filters)
+
+
+def test_process_images_queries_each_epoch(make_collection, epochs):
+    collection, _ = make_collection((40, 40))
+    aoi = {'center': (77.002, 19.998), 'radius_m': 150}
+    queries = []
+    cache = result_cache.ResultCache()
+    first = local_backend.process_images(aoi, *epochs, _RecordingIndex(collection, queries),
+                                         cache=cache)
+    assert queries and set(queries) == {epochs[:2], epochs[2:]}
+    # A scene outside both epochs is not queried, so the cache key holds
+    late = dict(collection[0], id='late', date='2024-06-01')
+    second = local_backend.process_images(
+        aoi, *epochs, _RecordingIndex(collection + [late], queries), cache=cache)
+    assert cache.stats == {'memory_hits': 1, 'disk_hits': 0, 'misses': 1}
+    assert all(a is b for a, b in zip(first, second))
+
+
+def test_collection_median_stays_within_max_bytes():
+    grid = benchmarks.synthetic_grid((256, 200))
+    out = np.empty(grid['shape'], dtype=np.float32)
+    for scenes in (3, 20):
+        stack = benchmarks.speckled_stack(scenes, grid['shape'])
+        stack[np.random.default_rng(scenes).random(stack.shape) < 0.2] = np.nan
+        collection = benchmarks.synthetic_collection(stack, grid)
+        for method in ('exact', 'histogram', 'histogram-single-pass'):
+            # Once untraced, so one-off allocations (imports, warning registries) are not counted
+            local_backend.collection_median(collection, grid, max_bytes=2**20, out=out,
+                                            method=method)
+            tracemalloc.start()
+            try:
+                local_backend.collection_median(collection, grid, max_bytes=2**20, out=out,
+                                                method=method)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            assert peak <= 2**20, (scenes, method, peak)
+
+
+def test_analysis_grid_covers_scenes_side_by_side():
+    # Two tiles on one lattice, each acquired twice per epoch, with the AOI across their edge
+    west_grid = benchmarks.synthetic_grid((60, 60))
+    east_grid = dict(west_grid, origin=(77.006, 20.0))
+    stack = benchmarks.speckled_stack(8, (60, 60))
+    collection = []
+    for i, (grid, data) in enumerate(zip([west_grid, east_grid] * 4, stack)):
+        collection.append({'id': f'tile{i}', 'date': str(np.datetime64('2024-01-01') + 6 * (i // 2)),
+                           'instrumentMode': 'IW', 'transmitterReceiverPolarisation': ['VV'],
+                           'bounds': local_backend.grid_bounds(grid), 'grid': grid, 'data': data})
+    aoi = {'center': (77.006, 19.997), 'radius_m': 200}
+    dates = ('2024-01-01', '2024-01-13', '2024-01-13', '2024-01-25')
+    grid = local_backend.analysis_grid(aoi, collection)
+    mask = local_backend.aoi_mask(aoi, grid)
+    results = local_backend.process_images(aoi, *dates, collection, grid)
+    seam = int(round((77.006 - grid['origin'][0]) / 1e-4))
+    assert mask[:, :seam].sum() > 400 and mask[:, seam:].sum() > 400
+    np.testing.assert_array_equal(~np.isnan(results[2]), mask)
+    reversed_grid = local_backend.analysis_grid(aoi, collection[::-1])
+    assert reversed_grid['shape'] == grid['shape']
+    np.testing.assert_allclose(reversed_grid['origin'], grid['origin'])
+    for a, b in zip(results, local_backend.process_images(aoi, *dates, collection[::-1])):
+        np.testing.assert_array_equal(a, b)
+
+    collection[1] = dict(collection[1], grid=dict(east_grid, origin=(77.00605, 20.0)))
+    with pytest.raises(ValueError, match="one pixel lattice"):
+        local_backend.analysis_grid(aoi, collection)
+
+
+@pytest.mark.parametrize('lee_radius, boxcar_radius', [(1, 1), (2, 5), (7, 3), (7, 7)])
+def test_fused_chain_matches_unfused(lee_radius, boxcar_radius):
+    grid = benchmarks.synthetic_grid((53, 41))
+    image1, image2 = benchmarks.speckled_stack(2, (53, 41))
+    image1[np.random.default_rng(0).random(image1.shape) < 0.05] = np.nan
+    aoi = {'center': (77.002, 19.9973), 'radius_m': 200}
+    mask = local_backend.aoi_mask(aoi, grid)
+    expected = local_backend._change_detection(image1, image2, mask, 0.1, lee_radius,
+                                               boxcar_radius, None, None, False)
+    for block_rows in (1, 2, 7, 16, 64, 256):
+        fused = local_backend.fused_change_detection(image1, image2, aoi, grid, 0.1, lee_radius,
+                                                     boxcar_radius, block_rows)
+        for a, b in zip(fused, expected):
+            np.testing.assert_array_equal(a, b)
+
+
+def test_process_images_fused_outputs(make_collection, epochs):
+    collection, grid = make_collection((40, 40))
+    aoi = {'center': (77.002, 19.998), 'radius_m': 150}
+    expected = local_backend.process_images(aoi, *epochs, collection, grid)
+    outputs = (None, None, np.empty(grid['shape'], np.float32), np.empty(grid['shape'], bool))
+    results = local_backend.process_images(aoi, *epochs, collection, grid, fused=True,
+                                           block_rows=5, outputs=outputs)
+    assert results[0] is None and results[2] is outputs[2]
+    np.testing.assert_array_equal(results[2], expected[2])
+    np.testing.assert_array_equal(results[3], expected[3])
+
+
+def _speckle_with_gaps(shape=(37, 53)):
+    image = benchmarks.speckled_stack(1, shape)[0]
+    image[np.random.default_rng(1).random(shape) < 0.1] = np.nan
+    image[:3, :4] = np.nan  # A fully masked window at radius 1
+    return image
+
+
+def _windowed_stats(image, radius):
+    # Brute-force (count, mean, variance) of the valid pixels in each window,
+    # clipped at the edges
+    rows, cols = image.shape
+    count, mean, variance = (np.full(image.shape, np.nan) for _ in range(3))
+    for r in range(rows):
+        for c in range(cols):
+            window = image[max(r - radius, 0):r + radius + 1, max(c - radius, 0):c + radius + 1]
+            window = window[~np.isnan(window)].astype(np.float64)
+            count[r, c] = window.size
+            if window.size:
+                mean[r, c], variance[r, c] = window.mean(), window.var()
+    return count, mean, variance
+
+
+@pytest.mark.parametrize('radius', [1, 2, 3, 7, 15, 26, 40])
+def test_enhanced_lee_filter_matches_windowed_reference(radius):
+    image = _speckle_with_gaps()
+    count, mean, variance = _windowed_stats(image, radius)
+    stats = local_backend._neighborhood_stats(image, radius)
+    np.testing.assert_allclose(stats[0], mean, rtol=1e-7)
+    np.testing.assert_allclose(stats[1], variance, rtol=1e-5, atol=1e-9)
+    with np.errstate(invalid='ignore'):
+        expected = mean + variance / (variance + 1e-6) * (image - mean)
+    filtered = local_backend.enhanced_lee_filter(image, radius)
+    assert filtered.dtype == np.float32
+    np.testing.assert_allclose(filtered, expected, rtol=1e-6, atol=1e-7)
+    assert (np.isnan(filtered) == (np.isnan(image) | (count == 0))).all()
+
+
+@pytest.mark.parametrize('gaps', [False, True])
+@pytest.mark.parametrize('radius', [1, 2, 3, 7, 15, 26, 40])
+def test_boxcar_filter_matches_windowed_reference(radius, gaps):
+    image = _speckle_with_gaps() if gaps else benchmarks.speckled_stack(1, (37, 53))[0]
+    _, mean, _ = _windowed_stats(image, radius)
+    mean[np.isnan(image)] = np.nan
+    filtered = local_backend.boxcar_filter(image, radius)
+    assert filtered.dtype == np.float32
+    np.testing.assert_allclose(filtered, mean, rtol=1e-6)
+
+
+def test_running_box_sum_clips_at_the_edges():
+    x = np.arange(1.0, 8.0)
+    for radius in (1, 3, 6, 10):
+        expected = [x[max(i - radius, 0):i + radius + 1].sum() for i in range(x.size)]
+        summed = x.copy()
+        local_backend._running_box_sum(summed, radius, 0)
+        np.testing.assert_array_equal(summed, expected)
+
+
+def test_boxcar_filter_radius_one_is_unchanged():
+    # The 3x3 mean of the valid neighbours, as before the radius became configurable
+    image = np.array([[1, 2, 3], [4, np.nan, 6], [7, 8, 9]], dtype=np.float32)
+    expected = np.array([[7 / 3, 16 / 5, 11 / 3],
+                         [22 / 5, np.nan, 28 / 5],
+                         [19 / 3, 34 / 5, 23 / 3]], dtype=np.float32)
+    np.testing.assert_array_equal(local_backend.boxcar_filter(image), expected)
+    np.testing.assert_array_equal(local_backend.boxcar_filter(image, radius=1), expected)
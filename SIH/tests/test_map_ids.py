@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+import map_ids
+
+
+class _Image:
+    # Stands in for ee.Image: an expression to serialize and a getMapId call
+    def __init__(self, expression, calls, barrier=None):
+        self.expression = expression
+        self.calls = calls
+        self.barrier = barrier
+
+    def serialize(self):
+        return self.expression
+
+    def getMapId(self, vis_params):
+        self.calls.append((self.expression, vis_params))
+        if self.barrier is not None:
+            # Only returns once every distinct request is in flight at once
+            self.barrier.wait(timeout=5)
+        return {'mapid': f"{self.expression}:{vis_params['max']}"}
+
+
+def test_distinct_requests_are_issued_concurrently():
+    calls = []
+    barrier = threading.Barrier(3)
+    requests = [(_Image(f"image{i}", calls, barrier), {'min': 0, 'max': i}) for i in range(3)]
+    result = map_ids.get_map_ids(requests)
+    assert result == [{'mapid': f"image{i}:{i}"} for i in range(3)]
+    assert len(calls) == 3
+
+
+def test_identical_requests_are_issued_once():
+    calls = []
+    requests = [(_Image('image', calls), {'min': 0, 'max': 1}),
+                (_Image('image', calls), {'max': 1, 'min': 0}),
+                (_Image('image', calls), {'min': 0, 'max': 2})]
+    result = map_ids.get_map_ids(requests)
+    assert calls == [('image', {'min': 0, 'max': 1}), ('image', {'min': 0, 'max': 2})]
+    assert result[0] is result[1] and result[2] == {'mapid': 'image:2'}
+
+
+def test_cached_map_ids_expire_after_ttl():
+    now = [0.0]
+    cache = map_ids.MapIdCache(ttl_seconds=60, clock=lambda: now[0])
+    calls = []
+    requests = [(_Image('image', calls), {'max': 1})]
+    first = map_ids.get_map_ids(requests, cache)
+    now[0] = 59.0
+    assert map_ids.get_map_ids(requests, cache) == first
+    assert len(calls) == 1 and cache.stats == {'hits': 1, 'misses': 1}
+    now[0] = 60.0
+    assert map_ids.get_map_ids(requests, cache) == first
+    assert len(calls) == 2 and cache.stats == {'hits': 1, 'misses': 2}
+
+
+def test_shared_cache_is_one_per_name():
+    caches = []
+    threads = [threading.Thread(target=lambda: caches.append(map_ids.shared_cache('test_map_ids')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(caches) == 8 and all(cache is caches[0] for cache in caches)
+    assert map_ids.shared_cache('other_test_map_ids') is not caches[0]
+
+
+@pytest.mark.parametrize('max_workers', [1, None])
+def test_map_ids_come_back_in_request_order(max_workers):
+    calls = []
+    requests = [(_Image(f"image{i % 3}", calls), {'max': i % 3}) for i in range(7)]
+    result = map_ids.get_map_ids(requests, max_workers=max_workers)
+    assert result == [{'mapid': f"image{i % 3}:{i % 3}"} for i in range(7)]
+    assert len(calls) == 3
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import local_backend
+import multires
+
+
+def test_decimate_averages_blocks_ignoring_nan():
+    image = np.arange(5 * 7, dtype=np.float32).reshape(5, 7)
+    image[0, 0] = np.nan
+    coarse = multires.decimate(image, 2, block_rows=2)
+    assert coarse.shape == (3, 4)
+    np.testing.assert_allclose(coarse[0, 0], np.mean([1, 7, 8]), rtol=1e-6)
+    assert coarse[2, 3] == image[4, 6]
+    np.testing.assert_allclose(coarse[1, 1], image[2:4, 2:4].mean())
+
+
+def test_empty_epoch_raises_like_the_full_resolution_path(make_collection):
+    collection, grid = make_collection((32, 32))
+    aoi = {'center': (77.0016, 19.9984), 'radius_m': 100}
+    dates = ('2024-01-01', '2024-01-19', '2025-01-01', '2025-02-01')
+    with pytest.raises(ValueError, match="No scenes between 2025-01-01 and 2025-02-01"):
+        local_backend.process_images(aoi, *dates, collection, grid)
+    with pytest.raises(ValueError, match="No scenes between 2025-01-01 and 2025-02-01"):
+        local_backend.process_images(aoi, *dates, collection, grid, coarse_factor=4)
+
+
+def test_refined_tiles_match_full_resolution(make_collection, epochs):
+    collection, grid = make_collection((64, 64))
+    aoi = {'center': (77.0032, 19.9968), 'radius_m': 300}
+    full = local_backend.process_images(aoi, *epochs, collection, grid)
+    coarse = local_backend.process_images(aoi, *epochs, collection, grid, coarse_factor=4,
+                                          coarse_threshold=0, tile_shape=(16, 16))
+    # With a zero coarse threshold every tile inside the AOI is refined
+    for a, b in zip(full, coarse):
+        np.testing.assert_allclose(b, a, rtol=1e-5, atol=1e-6)
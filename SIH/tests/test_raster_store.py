@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import local_backend
+import raster_store
+
+
+def test_windowed_and_strided_reads(tmp_path):
+    store = raster_store.RasterStore(tmp_path, (7, 5))
+    array = np.arange(23 * 31, dtype=np.float32).reshape(23, 31)
+    raster = store.put('a/b', array, {'note': 'x'})
+    assert 'a/b' in store and raster.metadata == {'note': 'x'}
+    for index in [np.s_[:, :], np.s_[::3, ::4], np.s_[2:20:5, 1:30:7], np.s_[3:4, 30:],
+                  np.s_[20:5, :], np.s_[::100, ::100], np.s_[6:8, 4:6], np.s_[5], np.s_[::-2, ::3]]:
+        np.testing.assert_array_equal(raster[index], array[index])
+    np.testing.assert_array_equal(np.asarray(store.open('a/b')), array)
+
+
+def test_integer_indexes_read_one_band(tmp_path, monkeypatch):
+    store = raster_store.RasterStore(tmp_path, (7, 5))
+    array = np.arange(23 * 31, dtype=np.float32).reshape(23, 31)
+    raster = store.put('a', array)
+    for index in [np.s_[5], np.s_[-1], np.s_[5, 7], np.s_[-23, -31], np.s_[:, 30], np.s_[2:9, 4],
+                  np.s_[np.int64(8), ::3], np.s_[22, 3:20:4]]:
+        np.testing.assert_array_equal(raster[index], array[index])
+        assert np.shape(raster[index]) == array[index].shape
+    read = []
+    chunk = raster._chunk
+    monkeypatch.setattr(raster, '_chunk', lambda i, j: read.append((i, j)) or chunk(i, j))
+    raster[9]
+    assert sorted(read) == [(1, j) for j in range(7)]
+    read.clear()
+    raster[9, 12]
+    assert read == [(1, 2)]
+    for index in [np.s_[23], np.s_[-24], np.s_[0, 31]]:
+        with pytest.raises(IndexError):
+            raster[index]
+
+
+def test_process_images_reads_stored_medians_lazily(tmp_path, monkeypatch, make_collection,
+                                                    epochs):
+    collection, grid = make_collection((48, 40))
+    aoi = {'center': (77.002, 19.9975), 'radius_m': 180}
+    store = raster_store.RasterStore(tmp_path, (16, 16))
+    expected = local_backend.process_images(aoi, *epochs, collection, grid)
+    first = local_backend.process_images(aoi, *epochs, collection, grid, store=store)
+    # Drop the stored results so that only the medians are reused
+    for path in (tmp_path / 'results').rglob('*.json'):
+        path.unlink()
+    medians = []
+    monkeypatch.setattr(local_backend, 'load_image_collection',
+                        lambda *args, **kwargs: medians.append(args))
+    second = local_backend.process_images(aoi, *epochs, collection, grid, store=store,
+                                          tile_shape=(16, 16))
+    assert not medians
+    for a, b, c in zip(expected, first, second):
+        np.testing.assert_allclose(np.asarray(b), a, rtol=1e-6)
+        np.testing.assert_allclose(np.asarray(c), a, rtol=1e-6)
+    for path in (tmp_path / 'results').rglob('*.json'):
+        path.unlink()
+    third = local_backend.process_images(aoi, *epochs, collection, grid, store=store)
+    for a, c in zip(expected, third):
+        np.testing.assert_allclose(c, a, rtol=1e-6)
+    assert not medians
+    stored = local_backend.process_images(aoi, *epochs, collection, grid, store=store)
+    assert all(isinstance(result, raster_store.LazyRaster) for result in stored)
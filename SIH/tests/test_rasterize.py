@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import benchmarks
+import local_backend
+import rasterize
+
+
+def _haversine_m(lon0, lat0, lons, lats):
+    phi0, phi = np.radians(lat0), np.radians(lats)
+    h = (np.sin((phi - phi0) / 2) ** 2
+         + np.cos(phi0) * np.cos(phi) * np.sin(np.radians(lons - lon0) / 2) ** 2)
+    return 2 * local_backend.EARTH_RADIUS_M * np.arcsin(np.sqrt(h))
+
+
+def _ray_cast(rings, lons, lats):
+    # Even-odd rule: count the edges crossed by a ray from each point towards +lon
+    inside = np.zeros(np.broadcast(lons, lats).shape, dtype=bool)
+    for ring in rings:
+        for (x0, y0), (x1, y1) in zip(ring, np.roll(ring, -1, axis=0)):
+            crosses = (y0 > lats) != (y1 > lats)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x = x0 + (lats - y0) * (x1 - x0) / (y1 - y0)
+            inside ^= crosses & (lons < x)
+    return inside
+
+
+@pytest.mark.parametrize('center, radius_m', [((77.01, 19.985), 900), ((77.0, 20.0), 1500),
+                                               ((76.95, 19.9), 500), ((77.02, 19.99), 30)])
+def test_circle_mask_matches_haversine(center, radius_m):
+    grid = benchmarks.synthetic_grid((300, 400))
+    mask = local_backend.aoi_mask({'center': center, 'radius_m': radius_m}, grid)
+    lons, lats = local_backend.pixel_centers(grid)
+    distance = _haversine_m(*center, lons[None, :], lats[:, None])
+    clear = np.abs(distance - radius_m) > 1e-3
+    np.testing.assert_array_equal(mask[clear], (distance <= radius_m)[clear])
+
+
+def test_circle_mask_near_pole():
+    grid = {'origin': (10.0, 89.9), 'pixel_size': (0.05, 0.001), 'shape': (200, 300)}
+    mask = local_backend.aoi_mask({'center': (15.0, 89.85), 'radius_m': 8000}, grid)
+    lons, lats = local_backend.pixel_centers(grid)
+    distance = _haversine_m(15.0, 89.85, lons[None, :], lats[:, None])
+    clear = np.abs(distance - 8000) > 1e-3
+    np.testing.assert_array_equal(mask[clear], (distance <= 8000)[clear])
+
+
+def test_polygon_mask_matches_ray_cast():
+    rng = np.random.default_rng(6)
+    grid = benchmarks.synthetic_grid((120, 150))
+    lons, lats = local_backend.pixel_centers(grid)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, 25))
+    radii = rng.uniform(0.002, 0.006, 25)
+    star = np.column_stack([77.0075 + radii * np.cos(angles), 19.994 + radii * np.sin(angles)])
+    # Vertices off the lattice of pixel centres, so no centre lies on an edge
+    hole = [[77.00613, 19.99317], [77.00907, 19.99321], [77.00811, 19.99589],
+            [77.00613, 19.99317]]
+    square = [[76.9999, 19.9885], [77.003, 19.9885], [77.003, 19.9905], [76.9999, 19.9905]]
+    geometries = [
+        {'type': 'Polygon', 'coordinates': [star.tolist()]},  # Open ring
+        {'type': 'Polygon', 'coordinates': [star.tolist() + [star[0].tolist()], hole]},
+        {'type': 'MultiPolygon', 'coordinates': [[star.tolist(), hole], [square]]},
+    ]
+    for geometry in geometries:
+        mask = local_backend.aoi_mask(geometry, grid)
+        rings = rasterize.polygon_rings(geometry)
+        expected = _ray_cast(rings, lons[None, :], lats[:, None])
+        assert expected.any()
+        np.testing.assert_array_equal(mask, expected)
+        window = (slice(30, 70), slice(20, 140))
+        np.testing.assert_array_equal(local_backend.aoi_mask(geometry, grid, window), mask[window])
+
+
+def test_unsupported_geometry():
+    with pytest.raises(ValueError):
+        rasterize.polygon_rings({'type': 'Point', 'coordinates': [77, 20]})
@@ -0,0 +1,52 @@
+import threading
+
+import numpy as np
+
+import result_cache
+
+
+def test_concurrent_use_keeps_byte_count(tmp_path):
+    cache = result_cache.ResultCache(max_entries=8, max_bytes=40 * 800, directory=tmp_path,
+                                     max_disk_bytes=20 * 1000)
+    errors = []
+
+    def work(seed):
+        rng = np.random.default_rng(seed)
+        try:
+            for _ in range(200):
+                key = int(rng.integers(30))
+                value = cache.get_or_compute(key, lambda: (np.full(100, key, dtype=np.float64),))
+                assert value[0][0] == key
+        except Exception as error:  # Surfaced in the main thread below
+            errors.append(error)
+
+    threads = [threading.Thread(target=work, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(cache.entries) <= 8
+    assert cache.memory_bytes == sum(result_cache._nbytes(value) for value in cache.entries.values())
+    assert sum(cache.stats.values()) == 8 * 200
+    assert not list(tmp_path.glob('*.tmp.npz'))
+
+
+def test_app_result_cache_persists_to_disk(tmp_path, monkeypatch):
+    import gglmfao
+    monkeypatch.setattr(result_cache, '_shared_caches', {})
+    monkeypatch.delenv('SIH_CACHE_DIR', raising=False)
+    monkeypatch.setenv('SIH_STORE', str(tmp_path / 'store'))
+    assert gglmfao.get_result_cache().directory == tmp_path / 'store' / 'result_cache'
+    monkeypatch.setattr(result_cache, '_shared_caches', {})
+    monkeypatch.setenv('SIH_CACHE_DIR', str(tmp_path / 'cache'))
+    cache = gglmfao.get_result_cache()
+    assert cache.directory == tmp_path / 'cache'
+    cache.put('key', (np.arange(3),))
+    # A fresh process finds it on disk
+    monkeypatch.setattr(result_cache, '_shared_caches', {})
+    np.testing.assert_array_equal(gglmfao.get_result_cache().get('key')[0], np.arange(3))
+    monkeypatch.setattr(result_cache, '_shared_caches', {})
+    monkeypatch.delenv('SIH_CACHE_DIR')
+    monkeypatch.delenv('SIH_STORE')
+    assert gglmfao.get_result_cache().directory is None
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import local_backend
+import scene_index
+
+
+def _linear_scan(records, bounds, start_date=None, end_date=None, mode='IW', polarisation='VV'):
+    start = np.datetime64(start_date or '0001-01-01', 's')
+    end = np.datetime64(end_date or '9999-12-31', 's')
+    return [record['id'] for record in records
+            if record['instrumentMode'] == mode
+            and polarisation in record['transmitterReceiverPolarisation']
+            and local_backend._intersects(record['bounds'], bounds)
+            and start <= np.datetime64(record['date'], 's') < end]
+
+
+def _queries():
+    rng = np.random.default_rng(1)
+    for size in (0.001, 0.3, 3, 30):
+        for _ in range(15):
+            west, south = rng.uniform(68, 92), rng.uniform(8, 32)
+            yield (west, south, west + size, south + size)
+
+
+def test_packed_rtree_matches_brute_force():
+    rng = np.random.default_rng(2)
+    corners = rng.uniform(0, 100, (700, 2))
+    boxes = np.column_stack([corners, corners + rng.uniform(0, 5, (700, 2))])
+    tree = scene_index.PackedRTree(boxes, node_size=4)
+    assert len(tree.levels) > 3
+    for bounds in [(10, 10, 20, 20), (0, 0, 100, 100), (50, 50, 50, 50), (200, 200, 300, 300)]:
+        expected = np.flatnonzero(scene_index._overlaps(boxes, bounds))
+        np.testing.assert_array_equal(np.sort(tree.query(bounds)), expected)
+    assert not len(scene_index.PackedRTree(np.empty((0, 4))).query((0, 0, 1, 1)))
+
+
+@pytest.mark.parametrize('dates', [(None, None), ('2023-03-01', '2023-03-09T12:00:00'),
+                                   ('2023-02-01', '2024-11-01'), ('2024-06-01', None)])
+def test_query_matches_linear_scan(scene_records, dates):
+    index = scene_index.SceneIndex(scene_records)
+    for bounds in _queries():
+        expected = _linear_scan(scene_records, bounds, *dates)
+        assert [scene['id'] for scene in index.query(bounds, *dates)] == expected
+    bounds = (70, 10, 90, 30)
+    assert ([scene['id'] for scene in index.query(bounds, *dates, mode='EW', polarisation='HH')]
+            == _linear_scan(scene_records, bounds, *dates, mode='EW', polarisation='HH'))
+
+
+def test_filter_collection_uses_the_index(scene_records):
+    aoi = {'center': (80.0, 20.0), 'radius_m': 50000}
+    expected = local_backend.filter_collection(scene_records, aoi)
+    assert local_backend.filter_collection(scene_index.SceneIndex(scene_records), aoi) == expected
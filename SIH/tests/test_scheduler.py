@@ -0,0 +1,98 @@
+import time
+from functools import partial
+
+import numpy as np
+import pytest
+
+import local_backend
+import scheduler
+import tiling
+
+
+def _sleep_then_return(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def _double_unless_marked(window, marker):
+    # Fails on tiles whose window holds the marker value
+    if (window == marker).any():
+        raise ValueError("marked tile")
+    return window * 2
+
+
+def test_ordered_and_unordered_collection():
+    # Later calls finish first
+    calls = [(i, _sleep_then_return, ((3 - i) * 0.1, i)) for i in range(4)]
+    ordered = [tag for tag, _, _ in scheduler.schedule_calls(calls, workers=4, ordered=True)]
+    assert ordered == [0, 1, 2, 3]
+    unordered = list(scheduler.schedule_calls(calls, workers=4, ordered=False))
+    assert [tag for tag, _, _ in unordered] != [0, 1, 2, 3]
+    assert sorted((tag, result) for tag, result, _ in unordered) == [(i, i) for i in range(4)]
+
+
+@pytest.mark.parametrize('max_pending', [1, 3])
+def test_max_pending_bounds_calls_in_flight(max_pending):
+    pulled = []
+
+    def calls():
+        for i in range(10):
+            pulled.append(i)
+            yield i, _sleep_then_return, (0.01, i)
+
+    collected = 0
+    for tag, result, error in scheduler.schedule_calls(calls(), workers=2, ordered=True,
+                                                       max_pending=max_pending):
+        collected += 1
+        assert error is None and result == tag
+        # Calls are only read as earlier ones are collected
+        assert len(pulled) <= collected - 1 + max_pending
+    assert collected == 10
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_failed_tiles_do_not_stop_the_others(shared):
+    image = np.arange(40 * 30, dtype=np.float32).reshape(40, 30)
+    marker = image[25, 3]
+    out = np.full(image.shape, -1, dtype=np.float32)
+    errors = scheduler.execute_tiles_parallel(partial(_double_unless_marked, marker=marker),
+                                              [image], (10, 10), 0, [out], workers=2,
+                                              shared=shared)
+    assert [tile['index'] for tile, _ in errors] == [(2, 0)]
+    assert all(isinstance(error, ValueError) for _, error in errors)
+    failed = np.zeros(image.shape, dtype=bool)
+    failed[20:30, 0:10] = True
+    assert (out[failed] == -1).all()
+    np.testing.assert_array_equal(out[~failed], image[~failed] * 2)
+
+
+def test_shared_memory_matches_pickled_tiles():
+    rng = np.random.default_rng(0)
+    before, after = rng.gamma(4.0, 0.05, size=(2, 70, 90)).astype(np.float32)
+    before[rng.random(before.shape) < 0.05] = np.nan
+    mask = rng.random(before.shape) > 0.1
+    chain = [(local_backend.enhanced_lee_filter, {'radius': 2}),
+             (local_backend.boxcar_filter, {'radius': 1})]
+    func = partial(local_backend.change_detection_tile, chain=chain, threshold=0.1)
+    halo = tiling.chain_halo(chain)
+
+    def outputs(allocate=np.empty):
+        return [allocate((70, 90), dtype=np.float32) for _ in range(3)] + \
+            [allocate((70, 90), dtype=bool)]
+
+    pickled = outputs()
+    assert scheduler.execute_tiles_parallel(func, [before, after, mask], (32, 24), halo,
+                                            pickled, workers=2) == []
+    copied = outputs()
+    assert scheduler.execute_tiles_parallel(func, [before, after, mask], (32, 24), halo,
+                                            copied, workers=2, shared=True) == []
+    with scheduler.SharedArrays() as shared:
+        inputs = [shared.copy(before), shared.copy(after), shared.copy(mask)]
+        allocated = outputs(shared.empty)
+        assert scheduler.execute_tiles_parallel(func, inputs, (32, 24), halo, allocated,
+                                                workers=2, shared=shared) == []
+        allocated = [np.array(out) for out in allocated]
+        del inputs
+    for expected, *others in zip(pickled, copied, allocated):
+        for other in others:
+            np.testing.assert_array_equal(other, expected)
@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import local_backend
+import scene_index
+import sqlite_catalog
+
+
+def _ids(scenes):
+    return [scene['id'] for scene in scenes]
+
+
+def _queries():
+    rng = np.random.default_rng(5)
+    for size in (0.001, 0.3, 3, 30):
+        for _ in range(10):
+            west, south = rng.uniform(68, 92), rng.uniform(8, 32)
+            yield (west, south, west + size, south + size)
+
+
+@pytest.fixture
+def catalog(tmp_path, scene_records):
+    source = tmp_path / 'catalog.jsonl'
+    source.write_text(''.join(json.dumps(record) + '\n' for record in scene_records))
+    (tmp_path / 'db').mkdir()
+    catalog, added = sqlite_catalog.build_catalog(source, tmp_path / 'db' / 'catalog.sqlite')
+    assert added == len(scene_records)
+    return catalog
+
+
+@pytest.mark.parametrize('dates', [(None, None), ('2023-03-01', '2023-03-09T12:00:00'),
+                                   ('2023-02-01', '2024-11-01')])
+def test_query_matches_scene_index(catalog, scene_records, dates):
+    index = scene_index.SceneIndex(scene_records)
+    for bounds in _queries():
+        assert _ids(catalog.query(bounds, *dates)) == _ids(index.query(bounds, *dates))
+    bounds = (70, 10, 90, 30)
+    assert (_ids(catalog.query(bounds, *dates, mode='EW', polarisation='HH'))
+            == _ids(index.query(bounds, *dates, mode='EW', polarisation='HH')))
+
+
+def test_orbit_filters_match_linear_scan(catalog, scene_records):
+    bounds = (75, 15, 85, 25)
+    expected = [record['id'] for record in scene_records
+                if record['relativeOrbitNumber_start'] == 3
+                and record['orbitProperties_pass'] == 'ASCENDING']
+    expected = [scene_id for scene_id in _ids(scene_index.SceneIndex(scene_records).query(bounds))
+                if scene_id in expected]
+    assert _ids(catalog.query(bounds, relative_orbit=3, orbit_pass='ASCENDING')) == expected
+
+
+def test_scenes_match_read_catalog(tmp_path, catalog, scene_records):
+    # Data paths stay relative to the JSON lines file after moving into db/
+    scenes = list(catalog)
+    assert len(catalog) == len(scenes) == len(scene_records)
+    expected = list(local_backend.read_catalog(tmp_path / 'catalog.jsonl'))
+    assert [Path(scene['data']).resolve() for scene in scenes] == \
+        [Path(scene['data']).resolve() for scene in expected]
+    assert [scene['bounds'] for scene in scenes] == [scene['bounds'] for scene in expected]
+    assert catalog.ingest(scene_records, tmp_path) == 0
+
+
+def test_without_rtree_matches(catalog, scene_records):
+    catalog.spatial = False
+    index = scene_index.SceneIndex(scene_records)
+    for bounds in _queries():
+        assert _ids(catalog.query(bounds)) == _ids(index.query(bounds))
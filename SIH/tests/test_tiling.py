@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import benchmarks
+import local_backend
+import tiling
+
+
+@pytest.mark.parametrize('tile_shape', [(5, 7), (16, 16), (100, 100), (3, 2)])
+@pytest.mark.parametrize('lee_radius, boxcar_radius', [(1, 1), (3, 2), (7, 7)])
+def test_tiled_chain_is_seam_free(tile_shape, lee_radius, boxcar_radius):
+    # Tiles as small as 2-3 pixels are far narrower than the halo of up to 14
+    image = benchmarks.speckled_stack(1, (61, 47), seed=3)[0]
+    image[np.random.default_rng(1).random(image.shape) < 0.1] = np.nan
+    chain = local_backend.filter_chain(lee_radius, boxcar_radius)
+    assert tiling.chain_halo(chain) == lee_radius + boxcar_radius
+    expected = tiling.apply_chain(chain, image)
+    np.testing.assert_array_equal(tiling.run_chain_tiled(chain, image, tile_shape), expected)
+
+
+def test_plan_tiles_cover_the_image_once():
+    tiles = tiling.plan_tiles((23, 17), (5, 7), 3)
+    covered = np.zeros((23, 17), dtype=int)
+    for tile in tiles:
+        covered[tile['core']] += 1
+        window = np.arange(23 * 17).reshape(23, 17)[tile['window']]
+        np.testing.assert_array_equal(window[tile['inner']],
+                                      np.arange(23 * 17).reshape(23, 17)[tile['core']])
+    assert (covered == 1).all()
+    assert len(tiles) == 5 * 3
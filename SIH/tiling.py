@@ -0,0 +1,79 @@
+import inspect
+
+import numpy as np
+
+# Tile planning and execution for neighbourhood filter chains. A chain is a
+# list of (function, kwargs) steps applied in order; any step whose function
+# takes a `radius` reaches that many pixels into its neighbours, so a tile
+# read with the summed radii as halo reproduces the untiled result in its core.
+
+
+def step_radius(func, kwargs):
+    parameters = inspect.signature(func).parameters
+    if 'radius' not in parameters:
+        return 0
+    return kwargs.get('radius', parameters['radius'].default)
+
+
+def chain_halo(chain):
+    return sum(step_radius(func, kwargs) for func, kwargs in chain)
+
+
+def apply_chain(chain, image):
+    for func, kwargs in chain:
+        image = func(image, **kwargs)
+    return image
+
+
+def plan_tiles(shape, tile_shape, halo):
+    rows, cols = shape
+    tile_rows, tile_cols = tile_shape
+    tiles = []
+    for r0 in range(0, rows, tile_rows):
+        for c0 in range(0, cols, tile_cols):
+            r1, c1 = min(r0 + tile_rows, rows), min(c0 + tile_cols, cols)
+            # The halo is clipped at the scene edges, where the filters already
+            # clip their windows the same way on the untiled image
+            wr0, wc0 = max(r0 - halo, 0), max(c0 - halo, 0)
+            wr1, wc1 = min(r1 + halo, rows), min(c1 + halo, cols)
+            tiles.append({
+                'index': (r0 // tile_rows, c0 // tile_cols),
+                'core': (slice(r0, r1), slice(c0, c1)),
+                'window': (slice(wr0, wr1), slice(wc0, wc1)),
+                'inner': (slice(r0 - wr0, r1 - wr0), slice(c0 - wc0, c1 - wc0)),
+            })
+    return tiles
+
+
+def read_windows(inputs, tile):
+    return [np.asarray(image[tile['window']]) for image in inputs]
+
+
+def run_window(func, windows, inner):
+    # Applies func to the haloed windows and returns only the core of each output
+    results = func(*windows)
+    if not isinstance(results, tuple):
+        results = (results,)
+    return tuple(result[inner] for result in results)
+
+
+def run_tile(func, inputs, tile):
+    return run_window(func, read_windows(inputs, tile), tile['inner'])
+
+
+def execute_tiles(func, inputs, tile_shape, halo, outputs):
+    for tile in plan_tiles(inputs[0].shape, tile_shape, halo):
+        for out, result in zip(outputs, run_tile(func, inputs, tile)):
+            out[tile['core']] = result
+    return outputs
+
+
+def run_chain_tiled(chain, image, tile_shape, out=None):
+    if out is None:
+        out = np.empty(image.shape, dtype=np.float32)
+
+    def func(window):
+        return apply_chain(chain, window)
+
+    execute_tiles(func, [image], tile_shape, chain_halo(chain), [out])
+    return out